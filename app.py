@@ -1,8 +1,13 @@
 import streamlit as st
-from llm_engine import get_ai_response, initialize_llm, regenerate_response
+from llm_engine import get_ai_response, initialize_llm, regenerate_response, build_lc_history, set_response_cache, get_llm, resolve_model, get_secret
+from model_router import AUTO_MODEL
 from database import Database
 from pdf_generator import generate_user_guide_pdf
-from web_search import search_web
+from web_search import search_web, answer_with_search, set_search_cache
+from search_router import SearchRouter
+from write_behind import WriteBehindQueue
+from response_cache import ResponseCache
+from metrics import metrics, STAGE_SECONDS
 from pathlib import Path
 from langchain_core.messages import HumanMessage, AIMessage
 import time
@@ -18,13 +23,76 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+def get_setting(name, default=None):
+    """Read an optional setting from Streamlit secrets or the environment"""
+    return get_secret(name, default)
+
 # Initialize database
 @st.cache_resource
 def get_database():
-    return Database()
+    # Optional compression of stored messages, e.g. DB_COMPRESSION = "zlib"
+    return Database(compression=get_setting("DB_COMPRESSION") or None)
 
 db = get_database()
 
+# Messages loaded per page when opening a saved conversation
+MESSAGE_PAGE_SIZE = 50
+
+# Longest the sidebar waits for queued saves before reading conversations
+SAVE_FLUSH_TIMEOUT = 2.0
+
+# Background writer for conversation saves
+@st.cache_resource
+def get_writer():
+    return WriteBehindQueue(get_database())
+
+writer = get_writer()
+
+# Response cache shared by all sessions, optionally persisted to disk
+@st.cache_resource
+def get_response_cache():
+    return ResponseCache(
+        ttl=float(get_setting("RESPONSE_CACHE_TTL", 24 * 3600)),
+        persist_path=get_setting("RESPONSE_CACHE_PATH") or None
+    )
+
+set_response_cache(get_response_cache())
+
+# Web search results shared by all sessions, keyed by normalized query
+@st.cache_resource
+def get_search_cache():
+    return ResponseCache(
+        max_entries=256,
+        ttl=float(get_setting("SEARCH_CACHE_TTL", 15 * 60)),
+        persist_path=get_setting("SEARCH_CACHE_PATH") or None
+    )
+
+set_search_cache(get_search_cache())
+
+# Decides in auto search mode whether a question needs the web; weights from "search_router.py train"
+@st.cache_resource
+def get_search_router():
+    weights_path = get_setting("SEARCH_ROUTER_WEIGHTS")
+    if weights_path:
+        try:
+            return SearchRouter.load(weights_path)
+        except Exception as e:
+            print(f"Error loading search router weights: {e}")
+    return SearchRouter()
+
+# Optional latency histograms, served at METRICS_PORT/metrics and/or written to METRICS_FILE
+@st.cache_resource
+def start_metrics():
+    metrics.enabled = str(get_setting("METRICS_ENABLED", "")).lower() in ("1", "true", "yes")
+    if metrics.enabled:
+        if get_setting("METRICS_PORT"):
+            metrics.serve(int(get_setting("METRICS_PORT")))
+        if get_setting("METRICS_FILE"):
+            metrics.write_periodically(get_setting("METRICS_FILE"))
+    return metrics
+
+start_metrics()
+
 # Initialize theme in session state (dark mode by default)
 if "theme_mode" not in st.session_state:
     st.session_state.theme_mode = "dark"
@@ -103,7 +171,8 @@ with st.sidebar:
             "llama-3.3-70b-versatile",
             "llama-3.1-70b-versatile", 
             "mixtral-8x7b-32768",
-            "gemma2-9b-it"
+            "gemma2-9b-it",
+            AUTO_MODEL
         ],
         index=0,
         help="Choose the AI model for your conversation"
@@ -114,7 +183,8 @@ with st.sidebar:
         "llama-3.3-70b-versatile": "⭐ Most powerful - Best for complex tasks",
         "llama-3.1-70b-versatile": "🚀 Fast & reliable - Great all-rounder",
         "mixtral-8x7b-32768": "🎨 Creative - Excellent for writing",
-        "gemma2-9b-it": "⚡ Quick - Fast responses"
+        "gemma2-9b-it": "⚡ Quick - Fast responses",
+        AUTO_MODEL: "🧭 Auto - Fastest available model right now"
     }
     st.caption(model_info.get(model_option, ""))
     
@@ -144,6 +214,21 @@ with st.sidebar:
         value=False,
         help="Get real-time information from the web"
     )
+    if enable_web_search:
+        search_mode = st.radio(
+            "Search mode",
+            ["🤖 Auto", "⚡ Fast", "🔬 Deep research"],
+            index=0,
+            horizontal=True,
+            help="Auto searches only when a question looks like it needs current information. "
+                 "Fast searches once and answers with citations in a single call. "
+                 "Deep research lets an agent search repeatedly; slower."
+        )
+        auto_search = search_mode == "🤖 Auto"
+        deep_research = search_mode == "🔬 Deep research"
+    else:
+        auto_search = False
+        deep_research = False
     
     # Streaming toggle
     enable_streaming = st.checkbox(
@@ -152,6 +237,15 @@ with st.sidebar:
         help="See responses as they're generated"
     )
     
+    # Memory mode
+    memory_mode = st.selectbox(
+        "🧠 Memory",
+        ["Full history", "Rolling summary"],
+        index=0,
+        help="Rolling summary sends a summary of older turns plus the latest messages, keeping long chats fast"
+    )
+    use_summary_memory = memory_mode == "Rolling summary"
+    
     # System prompt
     with st.expander("🎯 System Prompt"):
         custom_system_prompt = st.text_area(
@@ -169,39 +263,46 @@ with st.sidebar:
     if st.button("➕ New Chat", use_container_width=True):
         st.session_state.messages = []
         st.session_state.lc_history = []
+        st.session_state.messages_offset = 0
+        st.session_state.history_offset = 0
+        st.session_state.memory = {"summary": None, "covered": 0}
         st.session_state.current_conversation_id = None
         st.rerun()
     
     # Search conversations
     search_query = st.text_input("🔍 Search conversations", placeholder="Search...")
     
+    # Let queued saves land first, so the list, the counts and a clicked
+    # conversation include this session's latest turns
+    if writer.queue_depth:
+        writer.flush(SAVE_FLUSH_TIMEOUT)
+    
     # Load conversation history
     if search_query:
-        conversations = db.search_conversations(search_query)
+        conversations = db.search_conversations(search_query, limit=10)
     else:
-        conversations = db.get_all_conversations()
+        conversations = db.list_conversations(limit=10)
     
     # Display conversations
     if conversations:
         st.markdown("**Recent Chats:**")
-        for conv in conversations[:10]:  # Show last 10
+        for conv in conversations:
             col1, col2 = st.columns([4, 1])
             with col1:
                 if st.button(
-                    f"💬 {conv['title'][:25]}...", 
+                    f"💬 {(conv['title'] or 'New conversation')[:25]}...", 
                     key=f"load_{conv['id']}",
+                    help=conv.get('snippet'),
                     use_container_width=True
                 ):
-                    # Load conversation
-                    loaded = db.get_conversation(conv['id'])
+                    # Load only the most recent messages; older ones on demand
+                    loaded = db.get_conversation_window(conv['id'], limit=MESSAGE_PAGE_SIZE)
                     if loaded:
                         st.session_state.messages = loaded['messages']
-                        st.session_state.lc_history = []
-                        for msg in loaded['messages']:
-                            if msg['role'] == 'user':
-                                st.session_state.lc_history.append(HumanMessage(content=msg['content']))
-                            else:
-                                st.session_state.lc_history.append(AIMessage(content=msg['content']))
+                        st.session_state.messages_offset = loaded['offset']
+                        st.session_state.history_offset = loaded['offset']
+                        st.session_state.memory = loaded['memory']
+                        st.session_state.lc_history = build_lc_history(loaded['messages'])
                         st.session_state.current_conversation_id = conv['id']
                         st.rerun()
             with col2:
@@ -219,10 +320,11 @@ with st.sidebar:
         with col1:
             if st.button("📄 TXT", use_container_width=True):
                 # Export as text
-                text_content = f"ContextIQ Conversation\nExported: {datetime.now().strftime('%Y-%m-%d %H:%M')}\n\n"
+                parts = [f"ContextIQ Conversation\nExported: {datetime.now().strftime('%Y-%m-%d %H:%M')}\n\n"]
                 for msg in st.session_state.messages:
                     role = "You" if msg['role'] == 'user' else "ContextIQ"
-                    text_content += f"{role}:\n{msg['content']}\n\n"
+                    parts.append(f"{role}:\n{msg['content']}\n\n")
+                text_content = "".join(parts)
                 
                 st.download_button(
                     "💾 Download TXT",
@@ -267,7 +369,7 @@ with st.sidebar:
         st.metric("AI Responses", bot_msgs)
         
         # Total conversations in database
-        total_convs = len(db.get_all_conversations())
+        total_convs = db.count_conversations()
         st.metric("Total Conversations", total_convs)
     
     st.divider()
@@ -301,6 +403,16 @@ if "current_model" not in st.session_state:
 if "current_conversation_id" not in st.session_state:
     st.session_state.current_conversation_id = None
 
+if "messages_offset" not in st.session_state:
+    st.session_state.messages_offset = 0
+
+# Position of lc_history[0] in the saved conversation
+if "history_offset" not in st.session_state:
+    st.session_state.history_offset = 0
+
+if "memory" not in st.session_state:
+    st.session_state.memory = {"summary": None, "covered": 0}
+
 if "regenerate_index" not in st.session_state:
     st.session_state.regenerate_index = None
 
@@ -357,6 +469,18 @@ if not st.session_state.messages:
     </div>
     """, unsafe_allow_html=True)
 else:
+    # Older messages of a long conversation are fetched only when asked for
+    if st.session_state.messages_offset > 0:
+        if st.button(f"⬆️ Load earlier messages ({st.session_state.messages_offset} more)", use_container_width=True):
+            older, offset = db.get_message_page(
+                st.session_state.current_conversation_id,
+                limit=MESSAGE_PAGE_SIZE,
+                before_seq=st.session_state.messages_offset
+            )
+            st.session_state.messages = older + st.session_state.messages
+            st.session_state.messages_offset = offset
+            st.rerun()
+    
     # Display chat messages with action buttons
     for i, msg in enumerate(st.session_state.messages):
         if msg["role"] == "user":
@@ -401,6 +525,9 @@ else:
                         st.session_state.regenerate_index = i
                         st.rerun()
 
+# Rolling summary memory, updated in place by the LLM engine (None = full history)
+memory = st.session_state.memory if use_summary_memory else None
+
 # Handle regeneration
 if st.session_state.regenerate_index is not None:
     idx = st.session_state.regenerate_index
@@ -415,6 +542,7 @@ if st.session_state.regenerate_index is not None:
         # Regenerate
         with st.spinner("🔄 Regenerating response..."):
             start_time = time.time()
+            routing = {}
             
             try:
                 if enable_streaming:
@@ -426,7 +554,11 @@ if st.session_state.regenerate_index is not None:
                         max_tokens=max_tokens,
                         system_prompt=custom_system_prompt,
                         streaming=True,
-                        stream_container=stream_container
+                        stream_container=stream_container,
+                        memory=memory,
+                        history_offset=st.session_state.history_offset,
+                        model=model_option,
+                        routing=routing
                     )
                 else:
                     response = regenerate_response(
@@ -435,7 +567,11 @@ if st.session_state.regenerate_index is not None:
                         temperature=temperature,
                         max_tokens=max_tokens,
                         system_prompt=custom_system_prompt,
-                        streaming=False
+                        streaming=False,
+                        memory=memory,
+                        history_offset=st.session_state.history_offset,
+                        model=model_option,
+                        routing=routing
                     )
                 
                 response_time = time.time() - start_time
@@ -445,10 +581,22 @@ if st.session_state.regenerate_index is not None:
                     "role": "assistant",
                     "content": response,
                     "response_time": response_time,
-                    "regenerated": True
+                    "regenerated": True,
+                    "routing": routing
                 })
                 st.session_state.lc_history.append(AIMessage(content=response))
                 
+                # The reply was replaced in place, so the stored one must be rewritten
+                if st.session_state.current_conversation_id is not None:
+                    writer.save(
+                        st.session_state.current_conversation_id,
+                        st.session_state.messages,
+                        model=model_option,
+                        offset=st.session_state.messages_offset,
+                        memory=memory,
+                        dirty_from=st.session_state.messages_offset + len(st.session_state.messages) - 1
+                    )
+                
             except Exception as e:
                 error_msg = f"❌ Error regenerating: {str(e)}"
                 st.session_state.messages.append({
@@ -469,6 +617,9 @@ if user_input:
     
     # Determine if we should use web search
     use_web_search = enable_web_search
+    if use_web_search and auto_search:
+        with metrics.timer(STAGE_SECONDS, stage="search_routing"):
+            use_web_search = get_search_router().needs_search(user_input)
     
     # Generate AI response
     if enable_streaming:
@@ -477,13 +628,38 @@ if user_input:
     
     with st.spinner("🧠 Processing..."):
         start_time = time.time()
+        routing = {}
         
         try:
             # Check if web search should be used
-            if use_web_search:
-                # Use web search
-                from llm_engine import llm
-                response = search_web(user_input, llm)
+            if use_web_search and deep_research:
+                # Multi-step search agent
+                search_model = resolve_model(model_option)
+                routing = {"requested": model_option, "model": search_model}
+                llm = get_llm(search_model, temperature, max_tokens)
+                with metrics.timer(STAGE_SECONDS, stage="web_search"):
+                    response = search_web(
+                        user_input,
+                        llm,
+                        stream_container=stream_container if enable_streaming else None
+                    )
+                web_search_used = True
+            elif use_web_search:
+                # Search once, then one grounded answer
+                with metrics.timer(STAGE_SECONDS, stage="web_search"):
+                    response = answer_with_search(
+                        user_input,
+                        st.session_state.lc_history,
+                        temperature=temperature,
+                        max_tokens=max_tokens,
+                        system_prompt=custom_system_prompt,
+                        streaming=enable_streaming,
+                        stream_container=stream_container if enable_streaming else None,
+                        memory=memory,
+                        history_offset=st.session_state.history_offset,
+                        model=model_option,
+                        routing=routing
+                    )
                 web_search_used = True
             else:
                 # Regular response
@@ -495,7 +671,11 @@ if user_input:
                         max_tokens=max_tokens,
                         system_prompt=custom_system_prompt,
                         streaming=True,
-                        stream_container=stream_container
+                        stream_container=stream_container,
+                        memory=memory,
+                        history_offset=st.session_state.history_offset,
+                        model=model_option,
+                        routing=routing
                     )
                 else:
                     response = get_ai_response(
@@ -504,33 +684,43 @@ if user_input:
                         temperature=temperature,
                         max_tokens=max_tokens,
                         system_prompt=custom_system_prompt,
-                        streaming=False
+                        streaming=False,
+                        memory=memory,
+                        history_offset=st.session_state.history_offset,
+                        model=model_option,
+                        routing=routing
                     )
                 web_search_used = False
             
             response_time = time.time() - start_time
+            metrics.observe(STAGE_SECONDS, response_time, stage="response")
             
             # Add AI response
             st.session_state.messages.append({
                 "role": "assistant",
                 "content": response,
                 "response_time": response_time,
-                "web_search_used": web_search_used
+                "web_search_used": web_search_used,
+                "routing": routing
             })
             st.session_state.lc_history.append(AIMessage(content=response))
             
-            # Auto-save conversation
+            # Auto-save conversation in the background
+            title = None
             if st.session_state.current_conversation_id is None:
-                # Create new conversation
+                # New conversation, created on its first write
                 title = user_input[:50] if len(user_input) <= 50 else user_input[:47] + "..."
-                conv_id = db.create_conversation(title, model_option)
-                st.session_state.current_conversation_id = conv_id
+                st.session_state.current_conversation_id = writer.new_conversation_key()
             
-            # Update conversation
-            db.update_conversation(
-                st.session_state.current_conversation_id,
-                st.session_state.messages
-            )
+            with metrics.timer(STAGE_SECONDS, stage="save_enqueue"):
+                writer.save(
+                    st.session_state.current_conversation_id,
+                    st.session_state.messages,
+                    title=title,
+                    model=model_option,
+                    offset=st.session_state.messages_offset,
+                    memory=memory
+                )
             
         except Exception as e:
             error_msg = f"❌ Error: {str(e)}\n\nPlease try again."
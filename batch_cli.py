@@ -0,0 +1,159 @@
+"""
+Run prompts from a JSONL file through the chat engine without Streamlit
+
+Usage:
+    python batch_cli.py prompts.jsonl results.jsonl [--concurrency 8] [--model llama-3.3-70b-versatile]
+        [--temperature 0.3] [--max-tokens 2048] [--system-prompt TEXT | --system-prompt-file FILE]
+
+Each input line is an object with a "prompt" and optionally an "id",
+"history" (list of {"role", "content"}), "system_prompt", "model",
+"temperature" and "max_tokens". Lines without an id are numbered by
+position. Results are appended to the output as they finish, so an
+interrupted run picks up where it stopped: ids already answered there are
+skipped and failed ones are retried. GROQ_API_KEY is read from the
+environment when there is no .streamlit/secrets.toml.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+import llm_engine
+from db_cli import open_input, read_jsonl
+from metrics import metrics
+
+def load_checkpoint(path):
+    """Ids already answered successfully in an existing results file"""
+    done = set()
+    if path == "-" or not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                # Last line of a run that was killed mid-write
+                continue
+            if not result.get("error"):
+                done.add(result.get("id"))
+    return done
+
+def iter_prompts(lines):
+    """Yield (id, item) for each prompt, numbering items that have no id"""
+    for index, item in enumerate(read_jsonl(lines)):
+        if isinstance(item, str):
+            item = {"prompt": item}
+        yield item.get("id", index), item
+
+async def answer(item_id, item, args):
+    """Run one prompt and return its result record"""
+    routing = {}
+    start = time.perf_counter()
+    try:
+        history = item.get("history") or []
+        # The engine expects the current question as the last history entry
+        chat_history = llm_engine.build_lc_history(history + [{"role": "user", "content": item["prompt"]}])
+        response = await llm_engine.aget_ai_response(
+            item["prompt"],
+            chat_history,
+            temperature=item.get("temperature", args.temperature),
+            max_tokens=item.get("max_tokens", args.max_tokens),
+            system_prompt=item.get("system_prompt", args.system_prompt),
+            use_cache=not args.no_cache,
+            model=item.get("model", args.model),
+            routing=routing
+        )
+        # Engine errors come back as a message; the routing record tells them apart
+        attempts = routing.get("attempts") or []
+        error = attempts[-1]["error"] if attempts and not routing.get("cache_hit") else None
+    except Exception as e:
+        response, error = None, str(e)
+    return {
+        "id": item_id,
+        "prompt": item.get("prompt"),
+        "response": response,
+        "model": routing.get("model"),
+        "error": error,
+        "elapsed": round(time.perf_counter() - start, 3),
+    }
+
+async def run_batch(prompts, out, args, done=frozenset()):
+    """Answer prompts with at most args.concurrency in flight, writing each result as it lands"""
+    stats = {"completed": 0, "failed": 0, "skipped": 0}
+    slots = asyncio.Semaphore(args.concurrency)
+    pending = set()
+
+    async def worker(item_id, item):
+        try:
+            result = await answer(item_id, item, args)
+        finally:
+            slots.release()
+        out.write(json.dumps(result, ensure_ascii=False) + "\n")
+        out.flush()
+        stats["failed" if result["error"] else "completed"] += 1
+        finished = stats["completed"] + stats["failed"]
+        if args.progress and finished % args.progress == 0:
+            print(f"{finished} done ({stats['failed']} failed)", file=sys.stderr)
+
+    for item_id, item in prompts:
+        if item_id in done:
+            stats["skipped"] += 1
+            continue
+        # Only read ahead as far as there are free slots
+        await slots.acquire()
+        task = asyncio.create_task(worker(item_id, item))
+        pending.add(task)
+        task.add_done_callback(pending.discard)
+    if pending:
+        await asyncio.gather(*pending)
+    return stats
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Answer a JSONL file of prompts with ContextIQ")
+    parser.add_argument("input", help="JSONL prompts (.gz for gzip, - for stdin)")
+    parser.add_argument("output", help="JSONL results; appended to and used as the resume checkpoint")
+    parser.add_argument("--concurrency", type=int, default=8, help="Prompts in flight at once")
+    parser.add_argument("--model", default=llm_engine.DEFAULT_CONFIG["model"],
+                        help="Model name, or 'auto' for the fastest available")
+    parser.add_argument("--temperature", type=float, default=llm_engine.DEFAULT_CONFIG["temperature"])
+    parser.add_argument("--max-tokens", type=int, default=llm_engine.DEFAULT_CONFIG["max_tokens"])
+    parser.add_argument("--system-prompt", default=None, help="Replaces the default system prompt")
+    parser.add_argument("--system-prompt-file", default=None, help="Read the system prompt from a file")
+    parser.add_argument("--no-cache", action="store_true", help="Always call the model")
+    parser.add_argument("--progress", type=int, default=50, help="Report every N results (0 to disable)")
+    parser.add_argument("--metrics-file", default=None, help="Write stage latency histograms here (Prometheus format)")
+    args = parser.parse_args(argv)
+    metrics.enabled = bool(args.metrics_file)
+
+    if args.system_prompt_file:
+        with open(args.system_prompt_file, encoding="utf-8") as f:
+            args.system_prompt = f.read()
+
+    llm_engine.initialize_llm(model=args.model, temperature=args.temperature, max_tokens=args.max_tokens)
+
+    done = load_checkpoint(args.output)
+    source = open_input(args.input)
+    out = sys.stdout if args.output == "-" else open(args.output, "a", encoding="utf-8")
+    start = time.perf_counter()
+    try:
+        stats = asyncio.run(run_batch(iter_prompts(source), out, args, done))
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if out is not sys.stdout:
+            out.close()
+
+    elapsed = time.perf_counter() - start
+    if args.metrics_file:
+        metrics.write(args.metrics_file)
+    print(
+        f"Answered {stats['completed']} prompts ({stats['failed']} failed, {stats['skipped']} already done) "
+        f"in {elapsed:.1f}s",
+        file=sys.stderr
+    )
+    return 1 if stats["failed"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,127 @@
+"""
+Benchmark stored message compression: bytes on disk and encode/decode time
+
+Usage:
+    python benchmarks/bench_compression.py [--conversations 200] [--messages 40] [--output results.json]
+"""
+from pathlib import Path
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from compression import available_codecs, encode_content, decode_content
+from database import Database
+
+WORDS = (
+    "the a model token python function returns list dict value error request response "
+    "stream cache latency database query index search result answer question context "
+    "history prompt system user assistant example code markdown table step first then"
+).split()
+
+def synthetic_message(rng, role):
+    """A chat message that looks roughly like real assistant/user text"""
+    if role == "user":
+        length = rng.randint(8, 40)
+        return {"role": role, "content": " ".join(rng.choice(WORDS) for _ in range(length)) + "?"}
+    paragraphs = []
+    for _ in range(rng.randint(2, 6)):
+        sentence_count = rng.randint(2, 6)
+        sentences = [
+            " ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 20))).capitalize() + "."
+            for _ in range(sentence_count)
+        ]
+        paragraphs.append(" ".join(sentences))
+    if rng.random() < 0.3:
+        paragraphs.append("```python\ndef example(x):\n    return x * 2\n```")
+    return {"role": role, "content": "\n\n".join(paragraphs), "response_time": rng.random() * 3}
+
+def synthetic_conversations(count, messages_per_conversation, seed=7):
+    rng = random.Random(seed)
+    return [
+        [synthetic_message(rng, "user" if i % 2 == 0 else "assistant")
+         for i in range(messages_per_conversation)]
+        for _ in range(count)
+    ]
+
+def database_size(path):
+    """Size of the database including its WAL and shared-memory files"""
+    return sum(
+        os.path.getsize(p) for p in (path, path + "-wal", path + "-shm") if os.path.exists(p)
+    )
+
+def bench_codec(codec, conversations, workdir):
+    texts = [m["content"] for conv in conversations for m in conv]
+    raw_bytes = sum(len(t.encode("utf-8")) for t in texts)
+
+    start = time.perf_counter()
+    encoded = [encode_content(t, codec) for t in texts]
+    encode_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for content, blob in encoded:
+        decode_content(content, blob)
+    decode_s = time.perf_counter() - start
+
+    stored_bytes = sum(
+        len(blob) if blob is not None else len(content.encode("utf-8"))
+        for content, blob in encoded
+    )
+
+    db_path = os.path.join(workdir, f"bench_{codec or 'none'}.db")
+    db = Database(db_path, compression=codec)
+    start = time.perf_counter()
+    ids = []
+    for i, messages in enumerate(conversations):
+        conv_id = db.create_conversation(f"Conversation {i}", "bench")
+        db.update_conversation(conv_id, messages)
+        ids.append(conv_id)
+    save_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for conv_id in ids:
+        db.get_conversation(conv_id)
+    load_s = time.perf_counter() - start
+
+    with db.engine.connect() as conn:
+        conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.exec_driver_sql("VACUUM")
+    db.engine.dispose()
+
+    return {
+        "codec": codec or "none",
+        "messages": len(texts),
+        "raw_bytes": raw_bytes,
+        "stored_payload_bytes": stored_bytes,
+        "payload_ratio": round(stored_bytes / raw_bytes, 4),
+        "db_file_bytes": database_size(db_path),
+        "encode_ms": round(encode_s * 1000, 3),
+        "decode_ms": round(decode_s * 1000, 3),
+        "db_save_ms": round(save_s * 1000, 3),
+        "db_load_ms": round(load_s * 1000, 3),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--conversations", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=40)
+    parser.add_argument("--output", help="Write JSON results to this file instead of stdout")
+    args = parser.parse_args()
+
+    conversations = synthetic_conversations(args.conversations, args.messages)
+    with tempfile.TemporaryDirectory() as workdir:
+        results = [bench_codec(codec, conversations, workdir) for codec in [None] + available_codecs()]
+
+    report = json.dumps({"benchmark": "compression", "results": results}, indent=2)
+    if args.output:
+        Path(args.output).write_text(report)
+    else:
+        print(report)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+"""
+End-to-end benchmark of a chat turn, storage and web search against a local fake Groq API
+
+Usage:
+    python benchmarks/bench_e2e.py [--turns 20] [--ttft 0.05] [--tokens-per-sec 1000]
+        [--error-rate 0.2] [--db-sizes 10,100,1000] [--search-sizes 500,5000,20000]
+        [--output results.json]
+
+Runs fully offline: chat completions and Tavily searches are served by
+benchmarks/fake_groq.py on a random local port, and the database lives in
+a temporary directory. Latencies are reported in milliseconds; "overhead"
+is the measured time minus what the fake server spends by design
+(ttft + tokens / tokens_per_sec), i.e. the time our own code adds.
+"""
+from pathlib import Path
+import argparse
+import contextlib
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench_compression import synthetic_message
+from bench_stream_render import FakeContainer
+from fake_groq import FakeGroqConfig, FakeGroqServer
+from client_pool import ChatGroqPool
+from database import Database
+from langchain_core.messages import HumanMessage
+from rate_limiter import RateLimiter
+import llm_engine
+
+MODEL = "llama-3.3-70b-versatile"
+
+# 20000 conversations of 10 messages is a 200k message store
+SEARCH_MESSAGES_PER_CONVERSATION = 10
+
+def summarize(samples):
+    """Milliseconds summary of a list of second durations"""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return {
+        "n": len(ordered),
+        "mean_ms": round(statistics.mean(ordered) * 1000, 3),
+        "p50_ms": round(ordered[len(ordered) // 2] * 1000, 3),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+def synthetic_history(count, seed=11):
+    rng = random.Random(seed)
+    return [synthetic_message(rng, "user" if i % 2 == 0 else "assistant") for i in range(count)]
+
+def bench_turns(config, args, streaming):
+    """Latency of get_ai_response turns, with the server's designed time subtracted"""
+    history = llm_engine.build_lc_history(synthetic_history(args.history))
+    latencies, ttfts = [], []
+    for i in range(args.turns):
+        question = f"Benchmark question number {i}?"
+        chat = history + [HumanMessage(content=question)]
+        start = time.perf_counter()
+        if streaming:
+            # Same path as get_ai_response, but keeping the handler to read its TTFT
+            handler = llm_engine.StreamHandler(FakeContainer())
+            for token in llm_engine.iterate_in_loop(
+                llm_engine.astream_ai_response(question, chat, model=MODEL, use_cache=False)
+            ):
+                handler.on_llm_new_token(token)
+            handler.on_llm_end(None)
+            if handler.ttft is not None:
+                ttfts.append(handler.ttft)
+        else:
+            llm_engine.get_ai_response(question, chat, streaming=False, model=MODEL, use_cache=False)
+        latencies.append(time.perf_counter() - start)
+
+    designed = config.ttft + config.completion_tokens / config.tokens_per_sec
+    result = {
+        "latency": summarize(latencies),
+        "overhead": summarize([max(l - designed, 0.0) for l in latencies]),
+    }
+    if streaming:
+        result["ttft"] = summarize(ttfts)
+        result["ttft_overhead"] = summarize([max(t - config.ttft, 0.0) for t in ttfts])
+    return result
+
+def bench_cached_turns(args):
+    """Turn latency when the response cache answers"""
+    history = llm_engine.build_lc_history(synthetic_history(args.history))
+    question = "A question asked twice?"
+    chat = history + [HumanMessage(content=question)]
+    llm_engine.get_ai_response(question, chat, streaming=False, model=MODEL)
+    latencies = []
+    for _ in range(args.turns):
+        start = time.perf_counter()
+        llm_engine.get_ai_response(question, chat, streaming=False, model=MODEL)
+        latencies.append(time.perf_counter() - start)
+    return {"latency": summarize(latencies)}
+
+def bench_errors(config, args):
+    """Turns with injected upstream errors: success rate and latency including retries/failover"""
+    config.error_rate = args.error_rate
+    history = llm_engine.build_lc_history(synthetic_history(args.history))
+    latencies, failed, failovers = [], 0, 0
+    before = dict(config.stats)
+    try:
+        for i in range(args.turns):
+            question = f"Error injection question {i}?"
+            routing = {}
+            start = time.perf_counter()
+            llm_engine.get_ai_response(
+                question, history + [HumanMessage(content=question)],
+                streaming=False, model=MODEL, use_cache=False, routing=routing
+            )
+            latencies.append(time.perf_counter() - start)
+            attempts = routing.get("attempts") or []
+            if not attempts or attempts[-1]["error"]:
+                failed += 1
+            if len(attempts) > 1:
+                failovers += 1
+    finally:
+        config.error_rate = 0.0
+    return {
+        "error_rate": args.error_rate,
+        "latency": summarize(latencies),
+        "failed_turns": failed,
+        "failovers": failovers,
+        "server_requests": config.stats["requests"] - before["requests"],
+        "injected_errors": config.stats["errors"] - before["errors"],
+    }
+
+def bench_database(workdir, sizes, search_sizes, searches):
+    """Save, incremental save, window load, full load and search at several conversation sizes"""
+    db = Database(os.path.join(workdir, "bench.db"))
+    results = {}
+    for size in sizes:
+        messages = synthetic_history(size, seed=size)
+        timings = {"save": [], "append_turn": [], "load_window": [], "load_full": []}
+        for _ in range(5):
+            start = time.perf_counter()
+            conv_id = db.create_conversation("Benchmark", MODEL)
+            db.update_conversation(conv_id, messages)
+            timings["save"].append(time.perf_counter() - start)
+
+            turn = messages + [{"role": "user", "content": "one more?"}, {"role": "assistant", "content": "yes"}]
+            start = time.perf_counter()
+            db.update_conversation(conv_id, turn)
+            timings["append_turn"].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            db.get_conversation_window(conv_id)
+            timings["load_window"].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            db.get_conversation(conv_id)
+            timings["load_full"].append(time.perf_counter() - start)
+        results[str(size)] = {name: summarize(samples) for name, samples in timings.items()}
+
+    # Search latency as the store grows; "a" is a very common term that
+    # matches most messages, the worst case for ranking
+    rng = random.Random(5)
+    terms = ["latency", "database query", "stream cache", "python function", "a", "missingterm"]
+    results["search"] = {}
+    imported = 0
+    for count in search_sizes:
+        db.import_conversations(({
+            "title": f"Imported {i}",
+            "model": MODEL,
+            "messages": [synthetic_message(rng, "user" if j % 2 == 0 else "assistant")
+                         for j in range(SEARCH_MESSAGES_PER_CONVERSATION)],
+        } for i in range(imported, count)))
+        imported = max(imported, count)
+        timings = {term: [] for term in terms}
+        for _ in range(searches):
+            for term in terms:
+                start = time.perf_counter()
+                db.search_conversations(term, limit=10)
+                timings[term].append(time.perf_counter() - start)
+        results["search"][str(count)] = {
+            "conversations": db.count_conversations(),
+            "latency": summarize([sample for samples in timings.values() for sample in samples]),
+            "by_term": {term: summarize(samples) for term, samples in timings.items()},
+        }
+    return results
+
+def bench_web_search(config, args):
+    """Web search end to end, fast pipeline and agent; LLM and Tavily calls both hit the fake server"""
+    import langchain_community.utilities.tavily_search as tavily
+    from web_search import search_web, answer_with_search
+
+    # The Tavily wrapper has no base URL option, so point its module constant at the fake server
+    tavily.TAVILY_API_URL = args.server_url
+    os.environ.setdefault("TAVILY_API_KEY", "fake-key")
+    llm = llm_engine.get_llm(MODEL, temperature=0.3, max_tokens=512)
+
+    def run(name, search):
+        before = dict(config.stats)
+        latencies = []
+        for i in range(args.searches):
+            query = f"latest {name} benchmark news {i}"
+            start = time.perf_counter()
+            # The agent may print its reasoning; keep stdout for the JSON report
+            with contextlib.redirect_stdout(sys.stderr):
+                answer = search(query)
+            latencies.append(time.perf_counter() - start)
+        return {
+            "latency": summarize(latencies),
+            "llm_requests": config.stats["requests"] - before["requests"],
+            "tavily_requests": config.stats["searches"] - before["searches"],
+            "sample_answer": answer[:120],
+        }
+
+    return {
+        "fast": run("fast", lambda q: answer_with_search(
+            q, [HumanMessage(content=q)], streaming=False, model=MODEL
+        )),
+        "deep_research": run("deep", lambda q: search_web(q, llm)),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--history", type=int, default=20, help="Prior messages in each turn's history")
+    parser.add_argument("--ttft", type=float, default=0.05, help="Fake server seconds before the first token")
+    parser.add_argument("--tokens-per-sec", type=float, default=1000.0)
+    parser.add_argument("--completion-tokens", type=int, default=100)
+    parser.add_argument("--error-rate", type=float, default=0.2)
+    parser.add_argument("--db-sizes", default="10,100,1000", help="Messages per conversation to test")
+    parser.add_argument("--search-sizes", default="500,5000,20000",
+                        help="Stored conversation counts to time search at")
+    parser.add_argument("--searches", type=int, default=5)
+    parser.add_argument("--skip", default="", help="Comma-separated sections to skip: "
+                        "turns,cache,errors,database,web_search")
+    parser.add_argument("--output", help="Write JSON results to this file instead of stdout")
+    args = parser.parse_args()
+    skip = set(filter(None, args.skip.split(",")))
+
+    # Stay offline even if LangSmith tracing is configured for the app
+    os.environ["LANGCHAIN_TRACING_V2"] = "false"
+    os.environ["LANGSMITH_TRACING"] = "false"
+
+    config = FakeGroqConfig(args.ttft, args.tokens_per_sec, args.completion_tokens)
+    results = {}
+    with FakeGroqServer(config) as server, tempfile.TemporaryDirectory() as workdir:
+        args.server_url = server.url
+        # Real client stack (pool, rate limiter, router) pointed at the fake API
+        llm_engine.client_pool = ChatGroqPool(
+            "fake-key", base_url=server.url,
+            rate_limiter=RateLimiter(requests_per_minute=100000, tokens_per_minute=10 ** 9)
+        )
+        llm_engine.set_response_cache(llm_engine.ResponseCache())
+
+        if "turns" not in skip:
+            results["turn"] = bench_turns(config, args, streaming=False)
+            results["turn_streaming"] = bench_turns(config, args, streaming=True)
+        if "cache" not in skip:
+            results["turn_cached"] = bench_cached_turns(args)
+        if "errors" not in skip:
+            results["turn_with_errors"] = bench_errors(config, args)
+        if "database" not in skip:
+            sizes = [int(size) for size in args.db_sizes.split(",") if size]
+            search_sizes = [int(size) for size in args.search_sizes.split(",") if size]
+            results["database"] = bench_database(workdir, sizes, search_sizes, args.searches)
+        if "web_search" not in skip:
+            results["web_search"] = bench_web_search(config, args)
+
+    report = json.dumps({
+        "benchmark": "e2e",
+        "config": {
+            "turns": args.turns, "history": args.history, "ttft": args.ttft,
+            "tokens_per_sec": args.tokens_per_sec, "completion_tokens": args.completion_tokens,
+        },
+        "results": results,
+    }, indent=2)
+    if args.output:
+        Path(args.output).write_text(report)
+    else:
+        print(report)
+
+if __name__ == "__main__":
+    main()
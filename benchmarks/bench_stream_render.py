@@ -0,0 +1,88 @@
+"""
+Micro-benchmark of StreamHandler rendering on a synthetic token stream
+
+Usage:
+    python benchmarks/bench_stream_render.py [--tokens 4000] [--output results.json]
+"""
+from pathlib import Path
+import argparse
+import json
+import random
+import sys
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from llm_engine import StreamHandler
+
+class FakeContainer:
+    """Stands in for st.empty(); counts renders and bytes that would be sent"""
+
+    def __init__(self):
+        self.calls = 0
+        self.bytes_sent = 0
+
+    def markdown(self, text):
+        self.calls += 1
+        self.bytes_sent += len(text.encode("utf-8"))
+
+class PerTokenHandler:
+    """The previous StreamHandler: string concatenation and a render per token"""
+
+    def __init__(self, container):
+        self.container = container
+        self.text = ""
+
+    def on_llm_new_token(self, token, **kwargs):
+        self.text += token
+        self.container.markdown(self.text + "▌")
+
+    def on_llm_end(self, *args, **kwargs):
+        self.container.markdown(self.text)
+
+def synthetic_tokens(count, seed=3):
+    rng = random.Random(seed)
+    words = "the model streams tokens to the browser while the user waits for an answer".split()
+    return [(" " if i else "") + rng.choice(words) for i in range(count)]
+
+def run(handler_factory, tokens, token_interval):
+    container = FakeContainer()
+    handler = handler_factory(container)
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    for token in tokens:
+        handler.on_llm_new_token(token)
+        if token_interval:
+            time.sleep(token_interval)
+    handler.on_llm_end(None)
+    return {
+        "render_calls": container.calls,
+        "bytes_rendered": container.bytes_sent,
+        "cpu_ms": round((time.process_time() - cpu_start) * 1000, 3),
+        "wall_ms": round((time.perf_counter() - wall_start) * 1000, 3),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tokens", type=int, default=4000)
+    parser.add_argument("--token-interval", type=float, default=0.0,
+                        help="Seconds between tokens, to mimic generation speed")
+    parser.add_argument("--output", help="Write JSON results to this file instead of stdout")
+    args = parser.parse_args()
+
+    tokens = synthetic_tokens(args.tokens)
+    report = json.dumps({
+        "benchmark": "stream_render",
+        "tokens": args.tokens,
+        "results": {
+            "per_token": run(PerTokenHandler, tokens, args.token_interval),
+            "throttled": run(StreamHandler, tokens, args.token_interval),
+        }
+    }, indent=2)
+    if args.output:
+        Path(args.output).write_text(report)
+    else:
+        print(report)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""
+Local stand-in for the Groq chat-completions API (and Tavily search) for offline benchmarks
+
+Usage:
+    python benchmarks/fake_groq.py [--port 8099] [--ttft 0.2] [--tokens-per-sec 300]
+        [--completion-tokens 120] [--error-rate 0.0] [--error-status 429]
+
+Point a client at http://127.0.0.1:PORT (ChatGroq's base_url). Replies are
+streamed as server-sent events like the real API, with rate-limit headers.
+Prompts in the ReAct format used by web_search get a search action and
+then a final answer, so the search agent can run end to end.
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import json
+import random
+import threading
+import time
+
+WORDS = (
+    "latency throughput streaming tokens model answer request cache database "
+    "search result context window budget queue batch server client"
+).split()
+
+class FakeGroqConfig:
+    """Behaviour of the fake server; attributes may be changed while it runs"""
+
+    def __init__(self, ttft=0.2, tokens_per_sec=300.0, completion_tokens=120, error_rate=0.0,
+                 error_status=429, seed=7):
+        self.ttft = ttft
+        self.tokens_per_sec = tokens_per_sec
+        self.completion_tokens = completion_tokens
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "errors": 0, "searches": 0}
+
+    def count(self, name):
+        with self.lock:
+            self.stats[name] += 1
+
+    def should_fail(self):
+        with self.lock:
+            return self.rng.random() < self.error_rate
+
+def reply_tokens(config, messages, max_tokens):
+    """Tokens of the reply to messages"""
+    prompt = messages[-1].get("content", "") if messages else ""
+    if "Action Input:" in prompt and "tavily_search_results_json" in prompt:
+        # ReAct agent: search once, then answer
+        if "Observation:" in prompt.split("Question:")[-1]:
+            text = "Thought: I now know the final answer\nFinal Answer: " + " ".join(WORDS[:12])
+        else:
+            question = prompt.split("Question:")[-1].strip().splitlines()[0]
+            text = f"Thought: I should search\nAction: tavily_search_results_json\nAction Input: {question}"
+        return [piece + " " for piece in text.split(" ")]
+    count = min(config.completion_tokens, max_tokens or config.completion_tokens)
+    return [WORDS[i % len(WORDS)] + " " for i in range(count)]
+
+def make_handler(config):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _json(self, status, payload, headers=None):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _chunk(self, data):
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            if self.path.endswith("/search"):
+                self._search(request)
+            elif self.path.endswith("/chat/completions"):
+                self._chat(request)
+            else:
+                self._json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+        def _search(self, request):
+            config.count("searches")
+            time.sleep(config.ttft / 2)
+            query = request.get("query", "")
+            results = [{
+                "title": f"Result {i} for {query}",
+                "url": f"https://example.com/{i}",
+                "content": " ".join(WORDS[i:i + 10]),
+                "score": 1.0 - i / 10,
+            } for i in range(request.get("max_results", 5))]
+            self._json(200, {"query": query, "results": results, "images": [], "answer": None})
+
+        def _chat(self, request):
+            config.count("requests")
+            model = request.get("model", "fake")
+            headers = {
+                "x-ratelimit-limit-tokens": "1000000",
+                "x-ratelimit-remaining-tokens": "999000",
+                "x-ratelimit-remaining-requests": "14000",
+            }
+            if config.should_fail():
+                config.count("errors")
+                headers["retry-after"] = "0"
+                self._json(config.error_status, {
+                    "error": {"message": "Injected error", "type": "rate_limit_exceeded"
+                              if config.error_status == 429 else "internal_server_error"}
+                }, headers)
+                return
+
+            tokens = reply_tokens(config, request.get("messages", []), request.get("max_tokens"))
+            text = "".join(tokens)
+            stop = request.get("stop") or []
+            for marker in [stop] if isinstance(stop, str) else stop:
+                if marker in text:
+                    text = text.split(marker)[0]
+                    tokens = [piece + " " for piece in text.split(" ")]
+            time.sleep(config.ttft)
+
+            if not request.get("stream"):
+                time.sleep(len(tokens) / config.tokens_per_sec)
+                self._json(200, {
+                    "id": "chatcmpl-fake", "object": "chat.completion", "created": int(time.time()),
+                    "model": model,
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": text},
+                                 "finish_reason": "stop"}],
+                    "usage": {"prompt_tokens": 0, "completion_tokens": len(tokens), "total_tokens": len(tokens)},
+                }, headers)
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            interval = 1.0 / config.tokens_per_sec
+            next_at = time.perf_counter()
+            for token in tokens:
+                chunk = {
+                    "id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": int(time.time()),
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}],
+                }
+                self._chunk(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                next_at += interval
+                delay = next_at - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            done = {
+                "id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": int(time.time()),
+                "model": model, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+            }
+            self._chunk(f"data: {json.dumps(done)}\n\ndata: [DONE]\n\n".encode("utf-8"))
+            self._chunk(b"")
+
+    return Handler
+
+class FakeGroqServer:
+    """Run the fake API on a daemon thread; use as a context manager"""
+
+    def __init__(self, config=None, host="127.0.0.1", port=0):
+        self.config = config or FakeGroqConfig()
+        self.httpd = ThreadingHTTPServer((host, port), make_handler(self.config))
+        self.httpd.daemon_threads = True
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, name="fake-groq", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--ttft", type=float, default=0.2, help="Seconds before the first token")
+    parser.add_argument("--tokens-per-sec", type=float, default=300.0)
+    parser.add_argument("--completion-tokens", type=int, default=120)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests that fail")
+    parser.add_argument("--error-status", type=int, default=429)
+    args = parser.parse_args()
+
+    config = FakeGroqConfig(args.ttft, args.tokens_per_sec, args.completion_tokens,
+                            args.error_rate, args.error_status)
+    server = FakeGroqServer(config, port=args.port)
+    print(f"Fake Groq API listening on {server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Pool of reusable ChatGroq clients, one per generation configuration
+"""
+from collections import OrderedDict
+from langchain_groq import ChatGroq
+import httpx
+import threading
+
+from rate_limiter import httpx_event_hooks
+
+# Map old model names to new ones if needed
+MODEL_MAPPING = {
+    "llama-3.3-70b-versatile": "llama-3.3-70b-versatile",
+    "llama-3.1-70b-versatile": "llama-3.1-70b-versatile",
+    "mixtral-8x7b-32768": "mixtral-8x7b-32768",
+    "gemma2-9b-it": "gemma2-9b-it"
+}
+
+class ChatGroqPool:
+    """LRU pool of ChatGroq clients keyed by (model, temperature, max_tokens, streaming).
+
+    Clients are never mutated after creation, so any number of sessions can
+    share them. All clients use the same httpx connection pools, so warm
+    HTTP connections survive model switches and client eviction. With a
+    rate_limiter, every request on those connections waits for its turn.
+    """
+
+    def __init__(self, api_key, max_clients=16, max_connections=100, request_timeout=60,
+                 max_retries=3, base_url=None, rate_limiter=None):
+        self.api_key = api_key
+        self.max_clients = max_clients
+        self.request_timeout = request_timeout
+        self.max_retries = max_retries
+        self.base_url = base_url
+        self.rate_limiter = rate_limiter
+
+        sync_hooks, async_hooks = httpx_event_hooks(rate_limiter) if rate_limiter else (None, None)
+        limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self.http_client = httpx.Client(limits=limits, timeout=request_timeout, event_hooks=sync_hooks)
+        self.http_async_client = httpx.AsyncClient(limits=limits, timeout=request_timeout,
+                                                   event_hooks=async_hooks)
+
+        self._clients = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "created": 0, "evicted": 0}
+
+    @staticmethod
+    def make_key(model, temperature, max_tokens, streaming):
+        # Slider values like 0.30000000000000004 should share a client
+        return (MODEL_MAPPING.get(model, model), round(float(temperature), 3), int(max_tokens), bool(streaming))
+
+    def get(self, model, temperature, max_tokens, streaming=True):
+        """Return the client for this configuration, creating it if needed"""
+        key = self.make_key(model, temperature, max_tokens, streaming)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is not None:
+                self._clients.move_to_end(key)
+                self.stats["hits"] += 1
+                return client
+
+        client = self._create(*key)
+
+        with self._lock:
+            # Another thread may have built the same client meanwhile
+            existing = self._clients.get(key)
+            if existing is not None:
+                self._clients.move_to_end(key)
+                return existing
+            self._clients[key] = client
+            self.stats["created"] += 1
+            while len(self._clients) > self.max_clients:
+                self._clients.popitem(last=False)
+                self.stats["evicted"] += 1
+            return client
+
+    def _create(self, model, temperature, max_tokens, streaming):
+        return ChatGroq(
+            model=model,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            groq_api_key=self.api_key,
+            groq_api_base=self.base_url,
+            streaming=streaming,
+            max_retries=self.max_retries,
+            request_timeout=self.request_timeout,
+            http_client=self.http_client,
+            http_async_client=self.http_async_client,
+        )
+
+    def __len__(self):
+        with self._lock:
+            return len(self._clients)
+
+    def close(self):
+        """Close the shared HTTP connection pools"""
+        with self._lock:
+            self._clients.clear()
+        self.http_client.close()
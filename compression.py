@@ -0,0 +1,74 @@
+"""
+Compression of stored message payloads
+"""
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # Optional dependency
+    zstandard = None
+
+# Every compressed payload starts with MAGIC, a format version byte and a
+# codec id byte, so stored data can always be decoded whatever the current
+# settings are.
+MAGIC = b"CQ"
+FORMAT_VERSION = 1
+CODEC_IDS = {"zlib": 1, "zstd": 2}
+CODEC_NAMES = {v: k for k, v in CODEC_IDS.items()}
+
+# Payloads shorter than this are stored as plain text; they barely shrink
+DEFAULT_MIN_SIZE = 256
+
+def available_codecs():
+    """Codecs that can be used on this install"""
+    return [name for name in CODEC_IDS if name != "zstd" or zstandard is not None]
+
+def check_codec(codec):
+    """Raise ValueError if codec is unknown or its library is missing"""
+    if codec is None:
+        return
+    if codec not in CODEC_IDS:
+        raise ValueError(f"Unknown compression codec '{codec}'. Use one of: {', '.join(CODEC_IDS)}")
+    if codec == "zstd" and zstandard is None:
+        raise ValueError("zstd compression requires the 'zstandard' package")
+
+def compress(text: str, codec: str = "zlib", level: int = None) -> bytes:
+    """Compress text into a self-describing payload"""
+    check_codec(codec)
+    raw = text.encode("utf-8")
+    if codec == "zstd":
+        body = zstandard.ZstdCompressor(level=level or 3).compress(raw)
+    else:
+        body = zlib.compress(raw, level or 6)
+    return MAGIC + bytes([FORMAT_VERSION, CODEC_IDS[codec]]) + body
+
+def decompress(payload: bytes) -> str:
+    """Decode a payload produced by compress()"""
+    if payload[:2] != MAGIC:
+        raise ValueError("Not a compressed payload")
+    version, codec_id = payload[2], payload[3]
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported compressed payload version {version}")
+    codec = CODEC_NAMES.get(codec_id)
+    body = payload[4:]
+    if codec == "zstd":
+        if zstandard is None:
+            raise ValueError("Payload is zstd compressed but 'zstandard' is not installed")
+        raw = zstandard.ZstdDecompressor().decompress(body)
+    elif codec == "zlib":
+        raw = zlib.decompress(body)
+    else:
+        raise ValueError(f"Unknown compression codec id {codec_id}")
+    return raw.decode("utf-8")
+
+def encode_content(text, codec=None, min_size=DEFAULT_MIN_SIZE):
+    """Return (content, blob) for storage: one is set, the other is None"""
+    if codec is None or text is None or len(text) < min_size:
+        return text, None
+    return None, compress(text, codec)
+
+def decode_content(content, blob):
+    """Inverse of encode_content"""
+    if blob is None:
+        return content
+    return decompress(bytes(blob))
@@ -1,103 +1,738 @@
 """
 Database module for storing conversation history
 """
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, Float
+from sqlalchemy import create_engine, event, func, insert, or_, bindparam, Column, Integer, String, Text, DateTime, Float, Boolean, ForeignKey, Index, LargeBinary, inspect, text
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
+from contextlib import contextmanager
 from datetime import datetime
+from compression import check_codec, encode_content, decode_content, DEFAULT_MIN_SIZE
+from metrics import metrics, DB_SECONDS
 import json
+import re
 
 Base = declarative_base()
 
+# Message keys that have their own column; anything else goes into extra_json
+MESSAGE_COLUMNS = ('role', 'content', 'response_time', 'web_search_used', 'regenerated')
+
 class Conversation(Base):
     __tablename__ = 'conversations'
+    __table_args__ = (
+        Index('ix_conversations_updated_at_id', 'updated_at', 'id'),
+    )
     
     id = Column(Integer, primary_key=True, autoincrement=True)
     title = Column(String(200))
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     model = Column(String(100))
-    messages_json = Column(Text)  # Store messages as JSON
+    messages_json = Column(Text)  # Legacy blob, migrated into the messages table
     message_count = Column(Integer, default=0)
+    summary = Column(Text)  # Rolling summary of the earliest messages
+    summary_covered = Column(Integer, default=0)  # Number of messages the summary includes
+
+class Message(Base):
+    __tablename__ = 'messages'
+    __table_args__ = (
+        Index('ix_messages_conversation_seq', 'conversation_id', 'seq', unique=True),
+    )
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    conversation_id = Column(Integer, ForeignKey('conversations.id', ondelete='CASCADE'), nullable=False)
+    seq = Column(Integer, nullable=False)  # Position within the conversation
+    role = Column(String(20), nullable=False)
+    content = Column(Text)
+    content_blob = Column(LargeBinary)  # Compressed content; content is NULL when set
+    response_time = Column(Float)
+    web_search_used = Column(Boolean)
+    regenerated = Column(Boolean)
+    extra_json = Column(Text)  # Any other message keys
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+# Indexes created by older versions and since replaced
+OBSOLETE_INDEXES = ['ix_conversations_updated_at']
+
+# Bumped whenever SEARCH_INDEX_DDL changes so existing indexes get rebuilt
+SEARCH_INDEX_VERSION = 3
+
+SEARCH_INDEX_DROP = [
+    "DROP TRIGGER IF EXISTS conversations_fts_ai",
+    "DROP TRIGGER IF EXISTS conversations_fts_ad",
+    "DROP TRIGGER IF EXISTS conversations_fts_au",
+    "DROP TRIGGER IF EXISTS messages_fts_ai",
+    "DROP TRIGGER IF EXISTS messages_fts_ad",
+    "DROP TRIGGER IF EXISTS messages_fts_ad_blob",
+    "DROP TRIGGER IF EXISTS messages_fts_au",
+    "DROP TABLE IF EXISTS conversations_fts",
+    "DROP TABLE IF EXISTS messages_fts",
+    "DROP VIEW IF EXISTS messages_text",
+    "DROP TABLE IF EXISTS messages_fts_deleted",
+]
+
+# FTS5 indexes over conversation titles and message content. Both are
+# external-content tables kept in sync by triggers that use plain SQL only,
+# so other tools (the sqlite3 CLI, DB browsers) can still write to these
+# tables without our custom functions. Indexed text is read back (for
+# snippets and rebuilds) through the messages_text view, which decodes with
+# the cq_content() SQL function registered on our connections.
+#
+# Compressed messages have no plain content for a trigger to index, so
+# Database indexes them itself (COMPRESSED_INDEX_QUERY). Removing one from
+# the index needs its decoded text too: the delete trigger parks its blob
+# in messages_fts_deleted and Database unindexes it from there
+# (_apply_deleted), right after its own deletes and before its next write
+# otherwise.
+SEARCH_INDEX_DDL = [
+    "CREATE VIEW messages_text AS "
+    "SELECT id, cq_content(content, content_blob) AS content FROM messages",
+    "CREATE TABLE messages_fts_deleted (id INTEGER PRIMARY KEY, content_blob BLOB)",
+    "CREATE VIRTUAL TABLE conversations_fts USING fts5("
+    "title, content='conversations', content_rowid='id')",
+    "CREATE VIRTUAL TABLE messages_fts USING fts5("
+    "content, content='messages_text', content_rowid='id')",
+    "CREATE TRIGGER conversations_fts_ai AFTER INSERT ON conversations BEGIN "
+    "INSERT INTO conversations_fts(rowid, title) VALUES (new.id, new.title); END",
+    "CREATE TRIGGER conversations_fts_ad AFTER DELETE ON conversations BEGIN "
+    "INSERT INTO conversations_fts(conversations_fts, rowid, title) VALUES ('delete', old.id, old.title); END",
+    "CREATE TRIGGER conversations_fts_au AFTER UPDATE OF title ON conversations BEGIN "
+    "INSERT INTO conversations_fts(conversations_fts, rowid, title) VALUES ('delete', old.id, old.title); "
+    "INSERT INTO conversations_fts(rowid, title) VALUES (new.id, new.title); END",
+    "CREATE TRIGGER messages_fts_ai AFTER INSERT ON messages WHEN new.content IS NOT NULL BEGIN "
+    "INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content); END",
+    "CREATE TRIGGER messages_fts_ad AFTER DELETE ON messages WHEN old.content IS NOT NULL BEGIN "
+    "INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content); END",
+    "CREATE TRIGGER messages_fts_ad_blob AFTER DELETE ON messages "
+    "WHEN old.content IS NULL AND old.content_blob IS NOT NULL BEGIN "
+    "INSERT OR REPLACE INTO messages_fts_deleted(id, content_blob) VALUES (old.id, old.content_blob); END",
+    "CREATE TRIGGER messages_fts_au AFTER UPDATE OF content, content_blob ON messages BEGIN "
+    "INSERT INTO messages_fts(messages_fts, rowid, content) "
+    "SELECT 'delete', old.id, old.content WHERE old.content IS NOT NULL; "
+    "INSERT OR REPLACE INTO messages_fts_deleted(id, content_blob) "
+    "SELECT old.id, old.content_blob WHERE old.content IS NULL AND old.content_blob IS NOT NULL; "
+    "INSERT INTO messages_fts(rowid, content) SELECT new.id, new.content WHERE new.content IS NOT NULL; END",
+    "INSERT INTO conversations_fts(conversations_fts) VALUES ('rebuild')",
+    "INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')",
+    f"PRAGMA user_version = {SEARCH_INDEX_VERSION}",
+]
+
+# Indexes the compressed messages of some conversations from seq from_seq on
+COMPRESSED_INDEX_QUERY = text("""
+    INSERT INTO messages_fts(rowid, content)
+    SELECT id, cq_content(content, content_blob) FROM messages
+    WHERE conversation_id IN :conv_ids AND seq >= :from_seq
+      AND content IS NULL AND content_blob IS NOT NULL
+""").bindparams(bindparam('conv_ids', expanding=True))
+
+# Best-scoring hit per conversation among the newest :scan matching rows of
+# each FTS table (bm25 is lower-is-better). Walking the index in rowid order
+# stops after :scan rows, so the cost stays flat however many messages match.
+# SQLite fills the bare message_id column from the row that produced
+# MIN(score). snippet() decodes content, so it runs last and only for the
+# returned rows; they all lie in the rowid range that was just ranked, and the
+# unary + keeps FTS5 from turning the IN list into one MATCH per row.
+SEARCH_QUERY = text("""
+    WITH message_hits AS (
+        SELECT rowid AS message_id, bm25(messages_fts) AS score FROM messages_fts
+        WHERE messages_fts MATCH :query
+        ORDER BY rowid DESC LIMIT :scan
+    ), title_hits AS (
+        SELECT rowid AS conversation_id, bm25(conversations_fts) * 2 AS score FROM conversations_fts
+        WHERE conversations_fts MATCH :query
+        ORDER BY rowid DESC LIMIT :scan
+    ), best AS (
+        SELECT conversation_id, MIN(score) AS score, message_id
+        FROM (
+            SELECT m.conversation_id AS conversation_id, h.score AS score, h.message_id AS message_id
+            FROM message_hits h JOIN messages m ON m.id = h.message_id
+            UNION ALL
+            SELECT conversation_id, score, NULL FROM title_hits
+        )
+        GROUP BY conversation_id
+        ORDER BY score
+        LIMIT :limit
+    ), message_snippets AS (
+        SELECT rowid AS message_id, snippet(messages_fts, 0, '**', '**', '…', 12) AS snippet
+        FROM messages_fts
+        WHERE messages_fts MATCH :query
+          AND rowid >= (SELECT MIN(message_id) FROM best)
+          AND +rowid IN (SELECT message_id FROM best)
+    ), title_snippets AS (
+        SELECT rowid AS conversation_id, snippet(conversations_fts, 0, '**', '**', '…', 12) AS snippet
+        FROM conversations_fts
+        WHERE conversations_fts MATCH :query
+          AND rowid >= (SELECT MIN(conversation_id) FROM best WHERE message_id IS NULL)
+          AND +rowid IN (SELECT conversation_id FROM best WHERE message_id IS NULL)
+    )
+    SELECT best.conversation_id, best.score AS rank, COALESCE(ms.snippet, ts.snippet) AS snippet
+    FROM best
+    LEFT JOIN message_snippets ms ON ms.message_id = best.message_id
+    LEFT JOIN title_snippets ts ON best.message_id IS NULL AND ts.conversation_id = best.conversation_id
+    ORDER BY best.score
+""")
+
+# Matching rows ranked per search; older matches beyond this are not considered
+SEARCH_SCAN_LIMIT = 2000
+
+# Shorter last words match exactly: a prefix like "a*" or "re*" expands to a
+# large part of the vocabulary and has to merge all of its doclists
+MIN_PREFIX_CHARS = 3
+
+def _fts_query(query):
+    """Turn free text into a safe FTS5 query; a long enough last word matches as a prefix"""
+    words = re.findall(r"\w+", query)
+    if not words:
+        return None
+    terms = ['"%s"' % w for w in words]
+    if len(words[-1]) >= MIN_PREFIX_CHARS:
+        terms[-1] += '*'
+    return " ".join(terms)
+
+def _parse_datetime(value):
+    """Accept datetimes or ISO strings from imported data"""
+    if value is None:
+        return datetime.utcnow()
+    if isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(value)
+
+def _default_title(messages):
+    """Title for a conversation saved without one: its first question, shortened"""
+    for msg in messages:
+        if msg.get('role') == 'user' and msg.get('content'):
+            text = msg['content']
+            return text if len(text) <= 50 else text[:47] + "..."
+    return "New conversation"
+
+def _conversation_to_dict(conv):
+    """Summary dict for a conversation, without its messages"""
+    return {
+        'id': conv.id,
+        'title': conv.title,
+        'created_at': conv.created_at,
+        'updated_at': conv.updated_at,
+        'model': conv.model,
+        'message_count': conv.message_count
+    }
+
+def _message_values(conv_id, seq, msg, codec=None, min_size=DEFAULT_MIN_SIZE):
+    """Column values for a chat message dict, compressing content if codec is set"""
+    extra = {k: v for k, v in msg.items() if k not in MESSAGE_COLUMNS}
+    content, content_blob = encode_content(msg.get('content'), codec, min_size)
+    return dict(
+        conversation_id=conv_id,
+        seq=seq,
+        role=msg.get('role'),
+        content=content,
+        content_blob=content_blob,
+        response_time=msg.get('response_time'),
+        web_search_used=msg.get('web_search_used'),
+        regenerated=msg.get('regenerated'),
+        extra_json=json.dumps(extra) if extra else None,
+        created_at=datetime.utcnow()
+    )
+
+def _message_to_row(conv_id, seq, msg, codec=None, min_size=DEFAULT_MIN_SIZE):
+    """Build a Message row from a chat message dict"""
+    return Message(**_message_values(conv_id, seq, msg, codec, min_size))
+
+def _row_to_message(row):
+    """Convert a Message row back into the chat message dict used by the app"""
+    msg = {'role': row.role, 'content': decode_content(row.content, row.content_blob)}
+    for key in ('response_time', 'web_search_used', 'regenerated'):
+        value = getattr(row, key)
+        if value is not None:
+            msg[key] = value
+    if row.extra_json:
+        msg.update(json.loads(row.extra_json))
+    return msg
+
+def _load_messages(session, conv_id):
+    """Load the messages of a conversation in order within an open session"""
+    rows = session.query(Message).filter_by(
+        conversation_id=conv_id
+    ).order_by(Message.seq).all()
+    return [_row_to_message(r) for r in rows]
+
+def _load_message_page(session, conv_id, limit, before_seq=None):
+    """Load the newest limit messages before before_seq, oldest first, with the first seq"""
+    query = session.query(Message).filter(Message.conversation_id == conv_id)
+    if before_seq is not None:
+        query = query.filter(Message.seq < before_seq)
+    rows = query.order_by(Message.seq.desc()).limit(limit).all()
+    rows.reverse()
+    offset = rows[0].seq if rows else (before_seq or 0)
+    return [_row_to_message(r) for r in rows], offset
+
+def _apply_deleted(session):
+    """Unindex compressed messages parked in messages_fts_deleted by the delete trigger.
+    
+    If another tool has since reused one of their ids, the index cannot be
+    patched reliably and is rebuilt instead.
+    """
+    if session.execute(text("SELECT 1 FROM messages_fts_deleted LIMIT 1")).first() is None:
+        return
+    reused = session.execute(text(
+        "SELECT 1 FROM messages_fts_deleted d JOIN messages m ON m.id = d.id LIMIT 1"
+    )).first()
+    if reused:
+        session.execute(text("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')"))
+    else:
+        session.execute(text(
+            "INSERT INTO messages_fts(messages_fts, rowid, content) "
+            "SELECT 'delete', id, cq_content(NULL, content_blob) FROM messages_fts_deleted"
+        ))
+    session.execute(text("DELETE FROM messages_fts_deleted"))
+
+def _sync_messages(session, conv, messages, offset=0, codec=None, min_size=DEFAULT_MIN_SIZE, dirty_from=None,
+                   search_index=False):
+    """Write messages past the stored count, trimming stored ones if the list shrank.
+    
+    messages may be a window of the conversation whose first item has
+    seq == offset, as returned by Database.get_conversation_window.
+    Stored messages from seq dirty_from onwards are rewritten, for
+    messages that were changed in place (e.g. a regenerated reply).
+    Pass search_index=True when the FTS index exists, so compressed
+    messages are kept in it. Returns the seq of the first message written.
+    """
+    stored = conv.message_count or 0
+    total = offset + len(messages)
+    start = stored
+    if dirty_from is not None:
+        # Rows before the window cannot be rewritten from it
+        start = min(stored, max(dirty_from, offset))
+    if min(start, total) < stored:
+        session.query(Message).filter(
+            Message.conversation_id == conv.id,
+            Message.seq >= min(start, total)
+        ).delete(synchronize_session=False)
+        if search_index:
+            # Before the new rows are added, as they may reuse the deleted ids
+            _apply_deleted(session)
+    session.add_all(
+        _message_to_row(conv.id, seq, messages[seq - offset], codec, min_size)
+        for seq in range(max(start, offset), total)
+    )
+    conv.message_count = total
+    conv.updated_at = datetime.utcnow()
+    return max(start, offset)
+
+def _set_summary(conv, memory):
+    """Copy a rolling summary memory dict onto a Conversation row"""
+    conv.summary = memory.get('summary')
+    conv.summary_covered = memory.get('covered', 0)
 
 class Database:
-    def __init__(self, db_path="conversations.db"):
-        self.engine = create_engine(f'sqlite:///{db_path}')
+    def __init__(self, db_path="conversations.db", pool_size=5, max_overflow=10, busy_timeout_ms=5000,
+                 compression=None, compression_min_size=DEFAULT_MIN_SIZE):
+        # Optional 'zlib' or 'zstd' compression of new message content.
+        # Stored payloads are self-describing, so reads never depend on it.
+        check_codec(compression)
+        self.compression = compression
+        self.compression_min_size = compression_min_size
+        
+        # Connections come from a pool and are shared across Streamlit script
+        # threads, so each operation opens its own short-lived session.
+        self.engine = create_engine(
+            f'sqlite:///{db_path}',
+            poolclass=QueuePool,
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            pool_pre_ping=True,
+            connect_args={'check_same_thread': False}
+        )
+        self._configure_sqlite(busy_timeout_ms)
         Base.metadata.create_all(self.engine)
-        Session = sessionmaker(bind=self.engine)
-        self.session = Session()
+        self._ensure_columns()
+        self._ensure_indexes()
+        self.Session = sessionmaker(bind=self.engine)
+        self.fts_enabled = self._create_search_index()
+        self.migrate_legacy_messages()
+    
+    def _configure_sqlite(self, busy_timeout_ms):
+        """Enable WAL and a busy timeout on every new pooled connection"""
+        @event.listens_for(self.engine, "connect")
+        def _set_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute(f"PRAGMA busy_timeout={int(busy_timeout_ms)}")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+            cursor.close()
+            dbapi_connection.create_function(
+                "cq_content", 2, decode_content, deterministic=True
+            )
+    
+    def _ensure_columns(self):
+        """Add columns declared on the models to tables created by older versions"""
+        inspector = inspect(self.engine)
+        with self.engine.begin() as conn:
+            for table in Base.metadata.sorted_tables:
+                existing = {c['name'] for c in inspector.get_columns(table.name)}
+                for column in table.columns:
+                    if column.name not in existing:
+                        column_type = column.type.compile(dialect=self.engine.dialect)
+                        conn.execute(text(
+                            f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'
+                        ))
+    
+    def _ensure_indexes(self):
+        """Add indexes declared on the models to tables created by older versions"""
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(self.engine, checkfirst=True)
+        with self.engine.begin() as conn:
+            for name in OBSOLETE_INDEXES:
+                conn.execute(text(f'DROP INDEX IF EXISTS {name}'))
     
+    def _create_search_index(self):
+        """Create or upgrade the FTS5 search index; returns False if FTS5 is unavailable"""
+        with self.engine.connect() as conn:
+            version = conn.exec_driver_sql("PRAGMA user_version").scalar()
+        if version >= SEARCH_INDEX_VERSION and inspect(self.engine).has_table('messages_fts'):
+            return True
+        try:
+            with self.engine.begin() as conn:
+                for statement in SEARCH_INDEX_DROP + SEARCH_INDEX_DDL:
+                    conn.execute(text(statement))
+            return True
+        except OperationalError as e:
+            print(f"FTS5 unavailable, falling back to LIKE search: {e}")
+            return False
+    
+    def _index_compressed(self, session, conv_ids, from_seq=0):
+        """Add just-written compressed messages to the search index, which triggers cannot decode"""
+        conv_ids = [c for c in conv_ids if c is not None]
+        if not (self.compression and self.fts_enabled and conv_ids):
+            return
+        session.flush()
+        session.execute(COMPRESSED_INDEX_QUERY, {'conv_ids': conv_ids, 'from_seq': from_seq})
+    
+    @contextmanager
+    def _write_session(self):
+        """Session.begin() that first catches the search index up with deletes made by other tools"""
+        with self.Session.begin() as session:
+            if self.fts_enabled:
+                _apply_deleted(session)
+            yield session
+    
+    def migrate_legacy_messages(self):
+        """Move messages stored in Conversation.messages_json into the messages table"""
+        with self._write_session() as session:
+            legacy = session.query(Conversation).filter(
+                Conversation.messages_json.isnot(None)
+            ).all()
+            for conv in legacy:
+                messages = json.loads(conv.messages_json or "[]")
+                session.query(Message).filter_by(conversation_id=conv.id).delete()
+                if self.fts_enabled:
+                    _apply_deleted(session)
+                session.add_all(
+                    _message_to_row(conv.id, seq, msg, self.compression, self.compression_min_size)
+                    for seq, msg in enumerate(messages)
+                )
+                # Keep updated_at as-is so migrated threads keep their sidebar order
+                session.query(Conversation).filter_by(id=conv.id).update({
+                    'messages_json': None,
+                    'message_count': len(messages),
+                    'updated_at': Conversation.updated_at
+                }, synchronize_session=False)
+            self._index_compressed(session, [conv.id for conv in legacy])
+            return len(legacy)
+    
+    @metrics.timed(DB_SECONDS, operation="create_conversation")
     def create_conversation(self, title, model):
         """Create a new conversation"""
-        conv = Conversation(
-            title=title,
-            model=model,
-            messages_json=json.dumps([]),
-            message_count=0
-        )
-        self.session.add(conv)
-        self.session.commit()
-        return conv.id
-    
-    def update_conversation(self, conv_id, messages):
-        """Update conversation with new messages"""
-        conv = self.session.query(Conversation).filter_by(id=conv_id).first()
-        if conv:
-            conv.messages_json = json.dumps(messages)
-            conv.message_count = len(messages)
-            conv.updated_at = datetime.utcnow()
-            self.session.commit()
-            return True
-        return False
+        with self.Session.begin() as session:
+            conv = Conversation(
+                title=title,
+                model=model,
+                message_count=0
+            )
+            session.add(conv)
+            session.flush()
+            return conv.id
+    
+    @metrics.timed(DB_SECONDS, operation="append_messages")
+    def append_messages(self, conv_id, new_messages):
+        """Append new messages to a conversation without touching existing ones"""
+        with self._write_session() as session:
+            conv = session.query(Conversation).filter_by(id=conv_id).first()
+            if conv:
+                start = conv.message_count or 0
+                session.add_all(
+                    _message_to_row(conv_id, start + i, msg, self.compression, self.compression_min_size)
+                    for i, msg in enumerate(new_messages)
+                )
+                conv.message_count = start + len(new_messages)
+                conv.updated_at = datetime.utcnow()
+                self._index_compressed(session, [conv_id], start)
+                return True
+            return False
+    
+    @metrics.timed(DB_SECONDS, operation="update_conversation")
+    def update_conversation(self, conv_id, messages, offset=0, dirty_from=None):
+        """Update conversation with new messages.
+        
+        Only messages past the stored count are written; if the list got
+        shorter, the trailing stored messages are removed. Pass offset when
+        messages is a window that starts at that seq, and dirty_from when
+        stored messages from that seq on were edited in place.
+        """
+        with self._write_session() as session:
+            conv = session.query(Conversation).filter_by(id=conv_id).first()
+            if conv:
+                first_written = _sync_messages(session, conv, messages, offset, self.compression,
+                                               self.compression_min_size, dirty_from, self.fts_enabled)
+                self._index_compressed(session, [conv_id], first_written)
+                return True
+            return False
+    
+    @metrics.timed(DB_SECONDS, operation="save_conversations")
+    def save_conversations(self, items):
+        """Create or update several conversations in a single transaction.
+        
+        Each item is a dict with 'conv_id' (None to create), 'title', 'model',
+        'messages' and optionally 'offset', 'dirty_from' and 'memory'. Returns the conversation ids in the same
+        order, with None for ids that no longer exist. A conversation created
+        without a title is named after its first question.
+        """
+        ids = []
+        with self._write_session() as session:
+            for item in items:
+                if item['conv_id'] is None:
+                    conv = Conversation(title=item['title'] or _default_title(item['messages']),
+                                        model=item['model'], message_count=0)
+                    session.add(conv)
+                    session.flush()
+                else:
+                    conv = session.query(Conversation).filter_by(id=item['conv_id']).first()
+                if conv:
+                    first_written = _sync_messages(session, conv, item['messages'], item.get('offset', 0),
+                                                   self.compression, self.compression_min_size,
+                                                   item.get('dirty_from'), self.fts_enabled)
+                    self._index_compressed(session, [conv.id], first_written)
+                    if item.get('memory') is not None:
+                        _set_summary(conv, item['memory'])
+                ids.append(conv.id if conv else None)
+        return ids
+    
+    def get_messages(self, conv_id):
+        """Get all messages of a conversation in order"""
+        with self.Session() as session:
+            return _load_messages(session, conv_id)
+    
+    @metrics.timed(DB_SECONDS, operation="save_summary")
+    def save_summary(self, conv_id, memory):
+        """Store the rolling summary memory ({'summary', 'covered'}) of a conversation"""
+        with self.Session.begin() as session:
+            conv = session.query(Conversation).filter_by(id=conv_id).first()
+            if conv:
+                _set_summary(conv, memory)
+                return True
+            return False
+    
+    @metrics.timed(DB_SECONDS, operation="get_message_page")
+    def get_message_page(self, conv_id, limit=50, before_seq=None):
+        """Get up to limit messages ending just before before_seq (or at the end).
+        
+        Returns (messages, offset) where offset is the seq of the first
+        message returned; an offset of 0 means there is nothing older.
+        """
+        with self.Session() as session:
+            return _load_message_page(session, conv_id, limit, before_seq)
     
+    @metrics.timed(DB_SECONDS, operation="get_conversation_window")
+    def get_conversation_window(self, conv_id, limit=50):
+        """Get a conversation with only its last limit messages.
+        
+        'offset' is the seq of the first loaded message; pass it as
+        before_seq to get_message_page to fetch older messages.
+        """
+        with self.Session() as session:
+            conv = session.query(Conversation).filter_by(id=conv_id).first()
+            if conv:
+                messages, offset = _load_message_page(session, conv.id, limit)
+                return dict(
+                    _conversation_to_dict(conv),
+                    messages=messages,
+                    offset=offset,
+                    memory={'summary': conv.summary, 'covered': conv.summary_covered or 0}
+                )
+            return None
+    
+    @metrics.timed(DB_SECONDS, operation="get_conversation")
     def get_conversation(self, conv_id):
         """Get a specific conversation"""
-        conv = self.session.query(Conversation).filter_by(id=conv_id).first()
-        if conv:
-            return {
-                'id': conv.id,
-                'title': conv.title,
-                'created_at': conv.created_at,
-                'updated_at': conv.updated_at,
-                'model': conv.model,
-                'messages': json.loads(conv.messages_json),
-                'message_count': conv.message_count
-            }
-        return None
+        with self.Session() as session:
+            conv = session.query(Conversation).filter_by(id=conv_id).first()
+            if conv:
+                return dict(
+                    _conversation_to_dict(conv),
+                    messages=_load_messages(session, conv.id)
+                )
+            return None
     
     def get_all_conversations(self):
         """Get all conversations, sorted by most recent"""
-        convs = self.session.query(Conversation).order_by(Conversation.updated_at.desc()).all()
-        return [{
-            'id': c.id,
-            'title': c.title,
-            'created_at': c.created_at,
-            'updated_at': c.updated_at,
-            'model': c.model,
-            'message_count': c.message_count
-        } for c in convs]
+        with self.Session() as session:
+            convs = session.query(Conversation).order_by(Conversation.updated_at.desc()).all()
+            return [_conversation_to_dict(c) for c in convs]
+    
+    @metrics.timed(DB_SECONDS, operation="list_conversations")
+    def list_conversations(self, limit=10, before_updated_at=None, before_id=None):
+        """Get one page of conversations, most recent first.
+        
+        Pass the 'updated_at' and 'id' of the last row of a page as
+        before_updated_at and before_id to fetch the next page. The id
+        breaks ties between conversations updated at the same time.
+        """
+        with self.Session() as session:
+            query = session.query(Conversation)
+            if before_updated_at is not None:
+                after_cursor = Conversation.updated_at < before_updated_at
+                if before_id is not None:
+                    after_cursor = or_(after_cursor, (Conversation.updated_at == before_updated_at)
+                                       & (Conversation.id < before_id))
+                query = query.filter(after_cursor)
+            convs = query.order_by(
+                Conversation.updated_at.desc(), Conversation.id.desc()
+            ).limit(limit).all()
+            return [_conversation_to_dict(c) for c in convs]
+    
+    @metrics.timed(DB_SECONDS, operation="count_conversations")
+    def count_conversations(self):
+        """Get the total number of stored conversations"""
+        with self.Session() as session:
+            return session.query(func.count(Conversation.id)).scalar()
     
+    @metrics.timed(DB_SECONDS, operation="delete_conversation")
     def delete_conversation(self, conv_id):
         """Delete a conversation"""
-        conv = self.session.query(Conversation).filter_by(id=conv_id).first()
-        if conv:
-            self.session.delete(conv)
-            self.session.commit()
-            return True
-        return False
-    
-    def search_conversations(self, query):
-        """Search conversations by title or content"""
-        convs = self.session.query(Conversation).filter(
-            (Conversation.title.contains(query)) | 
-            (Conversation.messages_json.contains(query))
-        ).order_by(Conversation.updated_at.desc()).all()
+        with self._write_session() as session:
+            conv = session.query(Conversation).filter_by(id=conv_id).first()
+            if conv:
+                session.query(Message).filter_by(conversation_id=conv_id).delete()
+                if self.fts_enabled:
+                    _apply_deleted(session)
+                session.delete(conv)
+                return True
+            return False
+    
+    @metrics.timed(DB_SECONDS, operation="search_conversations")
+    def search_conversations(self, query, limit=50):
+        """Search conversations by title or content, best matches first.
+        
+        Each result carries a 'snippet' of the matched text.
+        """
+        if not self.fts_enabled:
+            return self._search_conversations_like(query, limit)
+        
+        fts_query = _fts_query(query)
+        if not fts_query:
+            return []
+        with self.Session() as session:
+            hits = session.execute(
+                SEARCH_QUERY, {'query': fts_query, 'limit': limit, 'scan': SEARCH_SCAN_LIMIT}
+            ).all()
+            if not hits:
+                return []
+            
+            convs = {c.id: c for c in session.query(Conversation).filter(
+                Conversation.id.in_([h.conversation_id for h in hits])
+            )}
+            return [
+                dict(_conversation_to_dict(c), snippet=h.snippet, rank=h.rank)
+                for h in hits if (c := convs.get(h.conversation_id))
+            ]
+    
+    def _search_conversations_like(self, query, limit):
+        """Substring search used when SQLite lacks FTS5"""
+        with self.Session() as session:
+            matching_ids = session.query(Message.conversation_id).filter(
+                func.cq_content(Message.content, Message.content_blob).contains(query)
+            )
+            convs = session.query(Conversation).filter(
+                (Conversation.title.contains(query)) | 
+                (Conversation.id.in_(matching_ids))
+            ).order_by(Conversation.updated_at.desc()).limit(limit).all()
+            
+            return [_conversation_to_dict(c) for c in convs]
+    
+    def iter_export(self, batch_size=500):
+        """Yield every conversation with its messages, oldest id first.
+        
+        Conversations are read in keyset pages of batch_size, so memory use
+        does not grow with the size of the store.
+        """
+        last_id = 0
+        while True:
+            with self.Session() as session:
+                convs = session.query(Conversation).filter(
+                    Conversation.id > last_id
+                ).order_by(Conversation.id).limit(batch_size).all()
+                if not convs:
+                    return
+                
+                messages = {c.id: [] for c in convs}
+                rows = session.query(Message).filter(
+                    Message.conversation_id.in_(list(messages))
+                ).order_by(Message.conversation_id, Message.seq).yield_per(1000)
+                for row in rows:
+                    messages[row.conversation_id].append(_row_to_message(row))
+                
+                page = [dict(
+                    _conversation_to_dict(c),
+                    summary=c.summary,
+                    summary_covered=c.summary_covered or 0,
+                    messages=messages[c.id]
+                ) for c in convs]
+                last_id = convs[-1].id
+            yield from page
+    
+    def import_conversations(self, conversations, batch_size=1000):
+        """Insert conversations (dicts shaped like iter_export output) in batched transactions.
+        
+        Imported conversations get new ids. Returns (conversations, messages) inserted.
+        """
+        conv_total = message_total = 0
+        batch = []
+        
+        def write(batch):
+            with self._write_session() as session:
+                conv_ids = session.scalars(
+                    insert(Conversation).returning(Conversation.id, sort_by_parameter_order=True),
+                    [{
+                        'title': conv.get('title'),
+                        'model': conv.get('model'),
+                        'created_at': _parse_datetime(conv.get('created_at')),
+                        'updated_at': _parse_datetime(conv.get('updated_at')),
+                        'message_count': len(conv.get('messages', [])),
+                        'summary': conv.get('summary'),
+                        'summary_covered': conv.get('summary_covered') or 0
+                    } for conv in batch]
+                ).all()
+                message_rows = [
+                    _message_values(conv_id, seq, msg, self.compression, self.compression_min_size)
+                    for conv_id, conv in zip(conv_ids, batch)
+                    for seq, msg in enumerate(conv.get('messages', []))
+                ]
+                if message_rows:
+                    session.execute(insert(Message), message_rows)
+                self._index_compressed(session, conv_ids)
+                return len(message_rows)
         
-        return [{
-            'id': c.id,
-            'title': c.title,
-            'created_at': c.created_at,
-            'updated_at': c.updated_at,
-            'model': c.model,
-            'message_count': c.message_count
-        } for c in convs]
+        pending_messages = 0
+        for conv in conversations:
+            batch.append(conv)
+            pending_messages += len(conv.get('messages', []))
+            # Batch by message volume so huge threads do not build giant transactions
+            if len(batch) >= batch_size or pending_messages >= batch_size * 20:
+                message_total += write(batch)
+                conv_total += len(batch)
+                batch, pending_messages = [], 0
+        if batch:
+            message_total += write(batch)
+            conv_total += len(batch)
+        return conv_total, message_total
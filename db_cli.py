@@ -0,0 +1,86 @@
+"""
+Command line tools for backing up and migrating the conversation store
+
+Usage:
+    python db_cli.py export backup.jsonl[.gz] [--db conversations.db]
+    python db_cli.py import backup.jsonl[.gz] [--db conversations.db] [--batch-size 1000]
+
+Use "-" as the file to stream through stdout/stdin.
+"""
+from datetime import datetime
+import argparse
+import gzip
+import json
+import sys
+import time
+
+from database import Database
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+def open_output(path):
+    if path == "-":
+        return sys.stdout
+    if path.endswith(".gz"):
+        return gzip.open(path, "wt", encoding="utf-8")
+    return open(path, "w", encoding="utf-8")
+
+def open_input(path):
+    if path == "-":
+        return sys.stdin
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, encoding="utf-8")
+
+def export_jsonl(db, out, batch_size=500):
+    """Write one JSON line per conversation; returns the number written"""
+    count = 0
+    for conv in db.iter_export(batch_size=batch_size):
+        out.write(json.dumps(conv, default=_json_default, ensure_ascii=False))
+        out.write("\n")
+        count += 1
+    return count
+
+def read_jsonl(lines):
+    """Parse conversations from JSON lines, skipping blank ones"""
+    for line in lines:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export or import ContextIQ conversations as JSONL")
+    parser.add_argument("command", choices=["export", "import"])
+    parser.add_argument("file", help="JSONL file (.gz for gzip, - for stdout/stdin)")
+    parser.add_argument("--db", default="conversations.db", help="SQLite database path")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Conversations per transaction/page")
+    args = parser.parse_args(argv)
+
+    db = Database(args.db)
+    start = time.perf_counter()
+
+    if args.command == "export":
+        out = open_output(args.file)
+        try:
+            count = export_jsonl(db, out, batch_size=args.batch_size)
+        finally:
+            if out is not sys.stdout:
+                out.close()
+        print(f"Exported {count} conversations in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+    else:
+        source = open_input(args.file)
+        try:
+            convs, messages = db.import_conversations(read_jsonl(source), batch_size=args.batch_size)
+        finally:
+            if source is not sys.stdin:
+                source.close()
+        print(
+            f"Imported {convs} conversations ({messages} messages) in {time.perf_counter() - start:.1f}s",
+            file=sys.stderr
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Token-budgeted conversation history for prompt construction
+"""
+from langchain_core.messages import SystemMessage
+import re
+
+# Context window sizes (tokens) of the models offered in the sidebar
+MODEL_CONTEXT_WINDOWS = {
+    "llama-3.3-70b-versatile": 131072,
+    "llama-3.1-70b-versatile": 131072,
+    "mixtral-8x7b-32768": 32768,
+    "gemma2-9b-it": 8192,
+}
+DEFAULT_CONTEXT_WINDOW = 8192
+
+# Per-message formatting overhead (role markers, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Headroom for estimator error, since the budget is only an estimate
+SAFETY_MARGIN = 0.1
+
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+def estimate_tokens(text: str) -> int:
+    """Approximate the token count of text without a tokenizer.
+
+    Each punctuation mark counts as one token and each word as one token
+    per started 6 characters, which tracks BPE tokenizers closely enough
+    for budgeting English text and code.
+    """
+    if not text:
+        return 0
+    return sum(
+        1 + (len(piece) - 1) // 6 if piece[0].isalnum() or piece[0] == "_" else 1
+        for piece in _TOKEN_PATTERN.findall(text)
+    )
+
+def estimate_message_tokens(message) -> int:
+    """Approximate tokens used by one LangChain message in a prompt"""
+    return estimate_tokens(str(message.content)) + MESSAGE_OVERHEAD_TOKENS
+
+def context_window(model: str) -> int:
+    """Context size of a model, falling back to a conservative default"""
+    return MODEL_CONTEXT_WINDOWS.get(model, DEFAULT_CONTEXT_WINDOW)
+
+def history_budget(model: str, max_tokens: int, system_prompt: str = "", user_input: str = "",
+                   max_history_tokens: int = None) -> int:
+    """Tokens left for history once the reply, system prompt and input are reserved"""
+    usable = int(context_window(model) * (1 - SAFETY_MARGIN))
+    reserved = (
+        (max_tokens or 0)
+        + estimate_tokens(system_prompt or "") + MESSAGE_OVERHEAD_TOKENS
+        + estimate_tokens(user_input or "") + MESSAGE_OVERHEAD_TOKENS
+    )
+    budget = max(usable - reserved, 0)
+    if max_history_tokens is not None:
+        budget = min(budget, max_history_tokens)
+    return budget
+
+def fit_history(history: list, budget: int) -> list:
+    """Keep the most recent messages of history that fit within budget tokens.
+
+    When older messages are dropped, a short system note saying how many were
+    omitted takes their place so the model knows the transcript is partial.
+    """
+    kept = []
+    used = 0
+    for message in reversed(history):
+        cost = estimate_message_tokens(message)
+        if used + cost > budget:
+            break
+        kept.append(message)
+        used += cost
+    kept.reverse()
+
+    dropped = len(history) - len(kept)
+    if dropped:
+        note = SystemMessage(content=f"({dropped} earlier messages of this conversation were omitted.)")
+        if used + estimate_message_tokens(note) > budget and kept:
+            kept.pop(0)
+            dropped += 1
+            note = SystemMessage(content=f"({dropped} earlier messages of this conversation were omitted.)")
+        kept.insert(0, note)
+    return kept
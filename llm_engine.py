@@ -1,15 +1,41 @@
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_groq import ChatGroq
-from langchain_core.messages import HumanMessage, AIMessage
+from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
 from langchain.callbacks.base import BaseCallbackHandler
+from response_cache import ResponseCache, make_cache_key
+from history_manager import fit_history, history_budget, estimate_message_tokens
+from client_pool import ChatGroqPool, MODEL_MAPPING
+from model_router import ModelRouter, FAILOVER_ERRORS, LOCAL_ERRORS, classify_error
+from metrics import metrics, STAGE_SECONDS, TOKENS_PER_SECOND
+from rate_limiter import (
+    RateLimiter, PRIORITY_INTERACTIVE, PRIORITY_REGENERATE, request_priority, request_cost
+)
 import streamlit as st
+import asyncio
 import os
+import queue
+import re
+import threading
+import time
+
+def get_secret(name: str, default=None):
+    """Read a setting from Streamlit secrets, falling back to the environment.
+    
+    Lets the engine run headless (batch jobs, scripts) with plain env vars.
+    """
+    try:
+        value = st.secrets.get(name)
+    except Exception:
+        # No secrets.toml, or not running under Streamlit
+        value = None
+    if value is None:
+        value = os.environ.get(name, default)
+    return value
 
 # LangSmith tracing setup
 def setup_langsmith_tracing():
     """Setup LangSmith tracing if API key is available"""
     try:
-        langsmith_key = st.secrets.get("LANGSMITH_API_KEY", "")
+        langsmith_key = get_secret("LANGSMITH_API_KEY", "")
         if langsmith_key:
             os.environ["LANGCHAIN_TRACING_V2"] = "true"
             os.environ["LANGCHAIN_ENDPOINT"] = "https://api.smith.langchain.com"
@@ -23,164 +49,683 @@ def setup_langsmith_tracing():
 
 # Streaming callback handler
 class StreamHandler(BaseCallbackHandler):
-    def __init__(self, container):
+    """Render streamed tokens into a Streamlit container.
+    
+    Tokens are buffered and the container is re-rendered at most every
+    flush_interval seconds or flush_chars new characters, whichever comes
+    first, instead of once per token.
+    
+    ttft is the time from creating the handler to the first token, as the
+    user sees it (cache lookups, summaries and queueing included).
+    
+    Before the first token, on_status shows progress lines such as
+    "Searching the web..." in the same container.
+    """
+    
+    def __init__(self, container, flush_interval: float = 0.05, flush_chars: int = 200):
         self.container = container
-        self.text = ""
+        self.flush_interval = flush_interval
+        self.flush_chars = flush_chars
+        self.parts = []
+        self.render_count = 0
+        self.started = time.monotonic()
+        self.ttft = None
+        self._pending_chars = 0
+        self._last_render = 0.0
+    
+    @property
+    def text(self) -> str:
+        return "".join(self.parts)
     
     def on_llm_new_token(self, token: str, **kwargs) -> None:
-        self.text += token
-        self.container.markdown(self.text + "▌")
+        self.parts.append(token)
+        self._pending_chars += len(token)
+        now = time.monotonic()
+        if self.ttft is None:
+            self.ttft = now - self.started
+            metrics.observe(STAGE_SECONDS, self.ttft, stage="ttft")
+        if (self._pending_chars >= self.flush_chars
+                or now - self._last_render >= self.flush_interval):
+            self._render("▌", now)
     
     def on_llm_end(self, *args, **kwargs) -> None:
-        self.container.markdown(self.text)
+        self._render("", time.monotonic())
+    
+    def on_status(self, status: str) -> None:
+        """Show a progress line until the answer starts streaming"""
+        if not self.parts:
+            self.container.markdown(f"_{status}_")
+            self.render_count += 1
+    
+    def _render(self, cursor: str, now: float) -> None:
+        # Collapse the buffer so the next join only covers new tokens
+        text = self.text
+        self.parts = [text]
+        with metrics.timer(STAGE_SECONDS, stage="render"):
+            self.container.markdown(text + cursor)
+        self.render_count += 1
+        self._pending_chars = 0
+        self._last_render = now
+
+def build_lc_history(messages: list, window: int = None) -> list:
+    """Convert stored chat messages into LangChain messages, optionally only the last `window`"""
+    if window is not None:
+        messages = messages[-window:] if window > 0 else []
+    return [
+        HumanMessage(content=msg['content']) if msg['role'] == 'user'
+        else AIMessage(content=msg['content'])
+        for msg in messages
+    ]
+
+def split_tokens(text: str) -> list:
+    """Split a complete response into word-sized pieces for replaying as a stream"""
+    return re.findall(r"\S+\s*|\s+", text)
 
-# Global LLM instance
-llm = None
-current_config = {}
+# Shared event loop for async generation. Every Streamlit thread submits its
+# requests here, so many generations overlap on one loop and one set of
+# HTTP connections.
+_loop = None
+_loop_lock = threading.Lock()
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """Return the background event loop, starting it on first use"""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="llm-event-loop", daemon=True).start()
+        return _loop
+
+def iterate_in_loop(async_iterator):
+    """Consume an async iterator on the shared loop, yielding its items on this thread"""
+    items = queue.Queue()
+    done = object()
+    
+    async def pump():
+        try:
+            async for item in async_iterator:
+                items.put(item)
+        except BaseException as e:
+            items.put(e)
+        finally:
+            items.put(done)
+    
+    asyncio.run_coroutine_threadsafe(pump(), get_event_loop())
+    while True:
+        item = items.get()
+        if item is done:
+            return
+        if isinstance(item, BaseException):
+            raise item
+        yield item
+
+# Exact-match cache of successful responses; None disables caching
+response_cache = ResponseCache()
+
+def set_response_cache(cache):
+    """Replace the response cache, or pass None to disable caching"""
+    global response_cache
+    response_cache = cache
+
+# Defaults for settings a caller does not pass
+DEFAULT_CONFIG = {
+    "model": "llama-3.3-70b-versatile",
+    "temperature": 0.3,
+    "max_tokens": 2048,
+}
+
+# Shared health and latency stats used to order models for each request
+model_router = ModelRouter(list(MODEL_MAPPING))
+
+# Models tried per request before giving up, and how long to wait for the
+# first token before failing over
+MAX_MODEL_ATTEMPTS = 3
+FIRST_TOKEN_TIMEOUT = 20
+
+def resolve_model(model: str = None) -> str:
+    """Concrete model to use for a request; resolves AUTO_MODEL to the fastest"""
+    return model_router.candidates(model or DEFAULT_CONFIG["model"])[0]
+
+# Shared pool of ChatGroq clients; built once, then only looked up
+client_pool = None
+_init_lock = threading.Lock()
 
 def initialize_llm(
     model: str = "llama-3.3-70b-versatile",
     temperature: float = 0.3,
     max_tokens: int = 2048,
     system_prompt: str = None,
-    streaming: bool = True
+    streaming: bool = True,
+    api_key: str = None
 ):
-    """Initialize the Groq LLM with specified parameters"""
-    global llm, current_config
+    """Initialize the Groq client pool and warm up the client for these parameters.
     
-    # Setup LangSmith tracing
-    setup_langsmith_tracing()
+    Safe to call from every session: the pool and LangSmith tracing are set
+    up only once, and switching models just looks up another pooled client.
+    The API key comes from api_key, Streamlit secrets or the environment.
+    """
+    global client_pool
     
-    # Get API key from Streamlit secrets
-    try:
-        api_key = st.secrets["GROQ_API_KEY"]
-    except:
+    api_key = api_key or get_secret("GROQ_API_KEY")
+    if not api_key:
         raise ValueError(
-            "GROQ_API_KEY not found in Streamlit secrets. "
+            "GROQ_API_KEY not found in Streamlit secrets or the environment. "
             "Please add it in your Streamlit Cloud dashboard or .streamlit/secrets.toml"
         )
     
     try:
-        # Initialize Groq LLM with proper model names
-        # Map old model names to new ones if needed
-        model_mapping = {
-            "llama-3.3-70b-versatile": "llama-3.3-70b-versatile",
-            "llama-3.1-70b-versatile": "llama-3.1-70b-versatile",
-            "mixtral-8x7b-32768": "mixtral-8x7b-32768",
-            "gemma2-9b-it": "gemma2-9b-it"
-        }
-        
-        actual_model = model_mapping.get(model, model)
-        
-        llm = ChatGroq(
-            model=actual_model,
-            temperature=temperature,
-            max_tokens=max_tokens,
-            groq_api_key=api_key,
-            streaming=streaming,
-            max_retries=3,
-            request_timeout=60,
-        )
-        
-        current_config = {
-            "model": model,
-            "temperature": temperature,
-            "max_tokens": max_tokens,
-            "system_prompt": system_prompt,
-            "streaming": streaming
-        }
+        with _init_lock:
+            if client_pool is None or client_pool.api_key != api_key:
+                # Setup LangSmith tracing
+                setup_langsmith_tracing()
+                # Defaults match Groq's free tier; set your plan's limits in secrets
+                rate_limiter = RateLimiter(
+                    requests_per_minute=int(get_secret("GROQ_RPM", 30)),
+                    tokens_per_minute=int(get_secret("GROQ_TPM", 6000))
+                )
+                client_pool = ChatGroqPool(api_key, rate_limiter=rate_limiter)
         
+        client_pool.get(resolve_model(model), temperature, max_tokens, streaming)
         return True
         
     except Exception as e:
         raise Exception(f"Failed to initialize LLM: {str(e)}")
 
+def get_llm(
+    model: str = None,
+    temperature: float = None,
+    max_tokens: int = None,
+    streaming: bool = True
+):
+    """Get the pooled ChatGroq client for these settings"""
+    if client_pool is None:
+        raise RuntimeError("LLM not initialized. Please restart the app.")
+    return client_pool.get(
+        model or DEFAULT_CONFIG["model"],
+        temperature if temperature is not None else DEFAULT_CONFIG["temperature"],
+        max_tokens if max_tokens is not None else DEFAULT_CONFIG["max_tokens"],
+        streaming
+    )
+
+DEFAULT_SYSTEM_PROMPT = (
+    "You are ContextIQ, an intelligent, professional, and helpful AI assistant. "
+    "Answer clearly, concisely, and accurately. Provide detailed explanations when needed. "
+    "Use proper formatting with markdown when appropriate. "
+    "If you are unsure about something, honestly say you do not know."
+)
+
 def get_prompt_template(system_prompt: str = None):
     """Create prompt template with optional custom system prompt"""
-    default_prompt = (
-        "You are ContextIQ, an intelligent, professional, and helpful AI assistant. "
-        "Answer clearly, concisely, and accurately. Provide detailed explanations when needed. "
-        "Use proper formatting with markdown when appropriate. "
-        "If you are unsure about something, honestly say you do not know."
-    )
-    
     prompt = ChatPromptTemplate.from_messages([
-        ("system", system_prompt or default_prompt),
+        ("system", system_prompt or DEFAULT_SYSTEM_PROMPT),
         MessagesPlaceholder(variable_name="history"),
         ("human", "{input}")
     ])
     
     return prompt
 
-def get_ai_response(
+# Rolling summary memory: the last SUMMARY_WINDOW messages are always sent
+# verbatim. Once more than twice that many are unsummarized, the older ones
+# are folded into the summary in a single call, so it is refreshed at most
+# once every SUMMARY_WINDOW messages.
+SUMMARY_WINDOW = 10
+
+SUMMARY_PROMPT = (
+    "You maintain a running summary of a conversation between a user and an AI assistant. "
+    "Update the summary with the new messages below. Keep facts, decisions, names, numbers, "
+    "code identifiers and open questions; drop pleasantries. Reply with the updated summary "
+    "only, in at most 250 words."
+)
+
+async def summarize_messages(previous_summary: str, messages: list, model: str = None) -> str:
+    """Fold messages into the previous summary with one LLM call"""
+    transcript = "\n\n".join(
+        f"{'User' if m.type == 'human' else 'Assistant'}: {m.content}" for m in messages
+    )
+    llm = get_llm(model, temperature=0.2, max_tokens=512, streaming=False)
+    response = await llm.ainvoke([
+        SystemMessage(content=SUMMARY_PROMPT),
+        HumanMessage(content=(
+            f"Current summary:\n{previous_summary or '(none)'}\n\n"
+            f"New messages:\n{transcript}"
+        ))
+    ])
+    return response.content.strip()
+
+async def apply_summary_memory(history: list, memory: dict, history_offset: int = 0,
+                               window: int = SUMMARY_WINDOW, model: str = None) -> list:
+    """Replace summarized history with the summary, updating memory when the window overflows.
+    
+    memory is a dict with 'summary' and 'covered', the number of messages
+    from the start of the conversation that the summary already includes.
+    history[0] is message number history_offset of the conversation.
+    """
+    start = min(max(memory.get("covered", 0) - history_offset, 0), len(history))
+    recent = history[start:]
+    
+    if len(recent) > 2 * window:
+        cut = len(recent) - window
+        try:
+            memory["summary"] = await summarize_messages(memory.get("summary"), recent[:cut], model)
+            memory["covered"] = history_offset + start + cut
+            recent = recent[cut:]
+        except Exception as e:
+            # Send the unsummarized messages this time and retry next turn
+            print(f"Summary update error: {e}")
+    
+    if memory.get("summary"):
+        note = SystemMessage(content=f"Summary of the earlier conversation:\n{memory['summary']}")
+        return [note] + recent
+    return recent
+
+def _error_message(e: Exception, model: str = None) -> str:
+    """Turn an LLM error into a helpful message for the chat"""
+    error_str = str(e).lower()
+    
+    # Provide helpful error messages
+    if "rate_limit" in error_str or "rate limit" in error_str:
+        return (
+            "⚠️ **Rate Limit Reached**\n\n"
+            "Please wait a moment and try again. Groq has generous free tier limits, "
+            "but they do apply per minute."
+        )
+    elif "api_key" in error_str or "authentication" in error_str:
+        return (
+            "⚠️ **API Key Issue**\n\n"
+            "Please check that your GROQ_API_KEY is correctly set in Streamlit secrets."
+        )
+    elif "timeout" in error_str:
+        return (
+            "⚠️ **Request Timeout**\n\n"
+            "The request took too long. Please try again or select a different model."
+        )
+    elif "model" in error_str or "not found" in error_str:
+        return (
+            f"⚠️ **Model Error**\n\n"
+            f"The model '{model}' may not be available. "
+            f"Try selecting a different model from the sidebar."
+        )
+    else:
+        return f"⚠️ **Error**: {str(e)}\n\nPlease try again or contact support if the issue persists."
+
+async def astream_ai_response(
     user_input: str,
     chat_history: list,
     temperature: float = None,
     max_tokens: int = None,
     system_prompt: str = None,
-    streaming: bool = True,
-    stream_container=None
-) -> str:
-    """Generate AI response with conversation history and optional streaming"""
-    global llm
+    use_cache: bool = True,
+    max_history_tokens: int = None,
+    memory: dict = None,
+    history_offset: int = 0,
+    model: str = None,
+    routing: dict = None,
+    priority: int = PRIORITY_INTERACTIVE
+):
+    """Async iterator over the tokens of an AI response.
+    
+    History is trimmed to the most recent messages that fit the model's
+    context after reserving max_tokens for the reply (and to
+    max_history_tokens if given). Passing a memory dict switches to rolling
+    summary mode (see apply_summary_memory); it is updated in place.
+    
+    model may be AUTO_MODEL to use the currently fastest model. If a model
+    is rate limited, times out or fails before its first token, the next
+    eligible model is tried. Pass a routing dict to get the decision.
+    Errors are yielded as a readable message instead of raised.
     
-    if llm is None:
+    Requests queue in the rate limiter by priority; lower values go first.
+    Identical requests made while one is generating share its tokens
+    instead of calling the model again (not when use_cache is False).
+    """
+    if client_pool is None:
         raise RuntimeError("LLM not initialized. Please restart the app.")
     
-    try:
-        # Update LLM settings if provided
-        if temperature is not None and temperature != current_config.get("temperature"):
-            llm.temperature = temperature
-        
-        if max_tokens is not None and max_tokens != current_config.get("max_tokens"):
-            llm.max_tokens = max_tokens
-        
-        # Get prompt template
-        prompt = get_prompt_template(system_prompt)
-        
+    # Applies to every Groq request made by the task consuming this stream,
+    # including the summary call below
+    request_priority.set(priority)
+    
+    requested = model or DEFAULT_CONFIG["model"]
+    effective_temperature = temperature if temperature is not None else DEFAULT_CONFIG["temperature"]
+    effective_max_tokens = max_tokens if max_tokens is not None else DEFAULT_CONFIG["max_tokens"]
+    candidates = model_router.candidates(requested)[:MAX_MODEL_ATTEMPTS]
+    routing = routing if routing is not None else {}
+    routing.update({"requested": requested, "model": None, "attempts": [], "cache_hit": False})
+    
+    def fitted_history(candidate):
+        budget = history_budget(
+            candidate,
+            effective_max_tokens,
+            system_prompt,
+            user_input,
+            max_history_tokens
+        )
+        return fit_history(history, budget)
+    
+    history = chat_history[:-1]  # Exclude current user message
+    if memory is not None:
+        with metrics.timer(STAGE_SECONDS, stage="summary_memory"):
+            history = await apply_summary_memory(history, memory, history_offset, model=candidates[0])
+    
+    request_key = make_cache_key(
+        requested,
+        effective_temperature,
+        effective_max_tokens,
+        system_prompt,
+        fitted_history(candidates[0]),
+        user_input
+    )
+    cache_key = request_key if response_cache is not None else None
+    if cache_key is not None and use_cache:
+        try:
+            cached = response_cache.get(cache_key)
+        except Exception as e:
+            # A broken cache tier must not fail the turn; treat it as a miss
+            print(f"Response cache read error: {e}")
+            cached = None
+        if cached is not None:
+            routing["cache_hit"] = True
+            for token in split_tokens(cached):
+                yield token
+            return
+    
+    # Get prompt template
+    prompt = get_prompt_template(system_prompt)
+    
+    def format_messages(candidate):
         # Format messages with history
-        messages = prompt.format_messages(
-            history=chat_history[:-1],  # Exclude current user message
+        return prompt.format_messages(
+            history=fitted_history(candidate),
             input=user_input
         )
+    
+    def generate(routing):
+        return _generate_with_failover(
+            candidates,
+            requested,
+            format_messages,
+            effective_temperature,
+            effective_max_tokens,
+            routing,
+            cache_key
+        )
+    
+    if not use_cache:
+        # Regenerations want an answer of their own, not a shared one
+        async for token in generate(routing):
+            yield token
+        return
+    
+    async for token in _single_flight(request_key, generate, routing):
+        yield token
+
+async def _generate_with_failover(candidates, requested, format_messages, temperature, max_tokens,
+                                  routing, cache_key=None):
+    """Stream tokens from the first candidate model that answers (see astream_ai_response)"""
+    last_error = None
+    
+    for candidate in candidates:
+        llm = get_llm(candidate, temperature, max_tokens)
+        parts = []
+        ttft = None
+        start = time.monotonic()
+        try:
+            # Format messages with history
+            with metrics.timer(STAGE_SECONDS, stage="prompt_format"):
+                messages = format_messages(candidate)
+            
+            if client_pool.rate_limiter is not None:
+                # Queue before the first-token timer starts, so waiting for
+                # our own rate limit does not count against the model
+                with metrics.timer(STAGE_SECONDS, stage="rate_limit_wait"):
+                    await client_pool.rate_limiter.admit(
+                        candidate,
+                        request_cost(sum(estimate_message_tokens(m) for m in messages), max_tokens)
+                    )
+                start = time.monotonic()
+            
+            chunks = llm.astream(messages).__aiter__()
+            try:
+                # Give up on a model that does not answer in time, so we can fail over
+                chunk = await asyncio.wait_for(chunks.__anext__(), FIRST_TOKEN_TIMEOUT)
+                while True:
+                    if chunk.content:
+                        if ttft is None:
+                            ttft = time.monotonic() - start
+                        parts.append(chunk.content)
+                        yield chunk.content
+                    chunk = await chunks.__anext__()
+            except StopAsyncIteration:
+                pass
+        except Exception as e:
+            kind = classify_error(e)
+            if kind not in LOCAL_ERRORS:
+                model_router.record_error(candidate, kind)
+            routing["attempts"].append({"model": candidate, "error": kind})
+            last_error = e
+            if not parts and kind in FAILOVER_ERRORS:
+                continue
+            routing["model"] = candidate
+            message = _error_message(e, candidate)
+            yield f"\n\n{message}" if parts else message
+            return
         
-        # Invoke LLM with or without streaming
-        if streaming and stream_container:
-            stream_handler = StreamHandler(stream_container)
-            response = llm.invoke(messages, config={"callbacks": [stream_handler]})
-            return response.content
-        else:
-            response = llm.invoke(messages)
-            return response.content
-        
+        duration = time.monotonic() - start - (ttft or 0)
+        model_router.record_success(candidate, ttft or 0.0, len(parts), duration)
+        if metrics.enabled:
+            metrics.observe(STAGE_SECONDS, ttft or 0.0, stage="model_ttft", model=candidate)
+            metrics.observe(STAGE_SECONDS, duration, stage="generation", model=candidate)
+            if duration > 0 and len(parts) > 1:
+                metrics.observe(TOKENS_PER_SECOND, len(parts) / duration, model=candidate)
+        routing["attempts"].append({"model": candidate, "error": None})
+        routing.update({
+            "model": candidate,
+            "ttft": round(ttft, 3) if ttft is not None else None,
+            "tokens_per_sec": round(len(parts) / duration, 1) if duration > 0 else None
+        })
+        if cache_key is not None:
+            try:
+                response_cache.put(cache_key, "".join(parts))
+            except Exception as e:
+                # The answer was already streamed; just skip storing it
+                print(f"Response cache write error: {e}")
+        return
+    
+    yield _error_message(last_error, requested)
+
+class _Flight:
+    """One upstream generation whose tokens are replayed to every subscriber.
+    
+    Subscribers may run on different event loops, so new tokens wake them
+    through their own loop.
+    """
+    
+    def __init__(self):
+        self.tokens = []
+        self.done = False
+        self.routing = None
+        self.subscribers = 0
+        self.task = None
+        self._waiters = set()
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _wake(waiters):
+        for loop, event in waiters:
+            loop.call_soon_threadsafe(event.set)
+    
+    def publish(self, token):
+        with self._lock:
+            self.tokens.append(token)
+            waiters = list(self._waiters)
+        self._wake(waiters)
+    
+    def finish(self, routing):
+        with self._lock:
+            self.routing = routing
+            self.done = True
+            waiters = list(self._waiters)
+        self._wake(waiters)
+    
+    async def subscribe(self):
+        """Yield every token so far, then new ones until the generation ends"""
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with self._lock:
+            self.subscribers += 1
+            self._waiters.add(waiter)
+        seen = 0
+        try:
+            while True:
+                with self._lock:
+                    # Clear before looking, so a publish after this cannot be missed
+                    waiter[1].clear()
+                    new = self.tokens[seen:]
+                    done = self.done
+                for token in new:
+                    yield token
+                seen += len(new)
+                if done and not new:
+                    return
+                if not new:
+                    await waiter[1].wait()
+        finally:
+            with self._lock:
+                self._waiters.discard(waiter)
+
+# Generations in progress, keyed by request (see _single_flight)
+_flights = {}
+_flights_lock = threading.Lock()
+single_flight_stats = {"generations": 0, "coalesced": 0}
+
+async def _run_flight(key, flight, generation, routing):
+    try:
+        async for token in generation:
+            flight.publish(token)
     except Exception as e:
-        error_str = str(e).lower()
-        
-        # Provide helpful error messages
-        if "rate_limit" in error_str or "rate limit" in error_str:
-            return (
-                "⚠️ **Rate Limit Reached**\n\n"
-                "Please wait a moment and try again. Groq has generous free tier limits, "
-                "but they do apply per minute."
-            )
-        elif "api_key" in error_str or "authentication" in error_str:
-            return (
-                "⚠️ **API Key Issue**\n\n"
-                "Please check that your GROQ_API_KEY is correctly set in Streamlit secrets."
-            )
-        elif "timeout" in error_str:
-            return (
-                "⚠️ **Request Timeout**\n\n"
-                "The request took too long. Please try again or select a different model."
-            )
-        elif "model" in error_str or "not found" in error_str:
-            return (
-                f"⚠️ **Model Error**\n\n"
-                f"The model '{current_config.get('model')}' may not be available. "
-                f"Try selecting a different model from the sidebar."
-            )
+        flight.publish(_error_message(e, routing.get("requested")))
+    finally:
+        # Later identical requests are served by the response cache instead
+        with _flights_lock:
+            if _flights.get(key) is flight:
+                del _flights[key]
+        flight.finish(routing)
+
+async def _single_flight(key, generate, routing):
+    """Attach identical concurrent requests to a single upstream generation.
+    
+    The first request for key starts generate() as a background task; it
+    and every identical request arriving before it finishes receive the
+    same tokens. The generation runs to completion even if its first
+    requester goes away, so the others still get the whole answer.
+    """
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+            single_flight_stats["generations"] += 1
         else:
-            return f"⚠️ **Error**: {str(e)}\n\nPlease try again or contact support if the issue persists."
+            single_flight_stats["coalesced"] += 1
+    
+    if leader:
+        flight_routing = {**routing, "attempts": []}
+        flight.task = asyncio.get_running_loop().create_task(
+            _run_flight(key, flight, generate(flight_routing), flight_routing)
+        )
+    
+    async for token in flight.subscribe():
+        yield token
+    
+    routing.update({**flight.routing, "attempts": list(flight.routing["attempts"]), "coalesced": not leader})
+
+async def aget_ai_response(
+    user_input: str,
+    chat_history: list,
+    temperature: float = None,
+    max_tokens: int = None,
+    system_prompt: str = None,
+    stream_handler: BaseCallbackHandler = None,
+    use_cache: bool = True,
+    max_history_tokens: int = None,
+    memory: dict = None,
+    history_offset: int = 0,
+    model: str = None,
+    routing: dict = None,
+    priority: int = PRIORITY_INTERACTIVE
+) -> str:
+    """Generate an AI response on the running event loop.
+    
+    Tokens are passed to stream_handler as they arrive, if one is given.
+    """
+    parts = []
+    async for token in astream_ai_response(
+        user_input,
+        chat_history,
+        temperature=temperature,
+        max_tokens=max_tokens,
+        system_prompt=system_prompt,
+        use_cache=use_cache,
+        max_history_tokens=max_history_tokens,
+        memory=memory,
+        history_offset=history_offset,
+        model=model,
+        routing=routing,
+        priority=priority
+    ):
+        parts.append(token)
+        if stream_handler:
+            stream_handler.on_llm_new_token(token)
+    if stream_handler:
+        stream_handler.on_llm_end(None)
+    return "".join(parts)
+
+def get_ai_response(
+    user_input: str,
+    chat_history: list,
+    temperature: float = None,
+    max_tokens: int = None,
+    system_prompt: str = None,
+    streaming: bool = True,
+    stream_container=None,
+    use_cache: bool = True,
+    max_history_tokens: int = None,
+    memory: dict = None,
+    history_offset: int = 0,
+    model: str = None,
+    routing: dict = None,
+    priority: int = PRIORITY_INTERACTIVE,
+    stream_handler: StreamHandler = None
+) -> str:
+    """Generate AI response with conversation history and optional streaming.
+    
+    Runs astream_ai_response on the shared event loop; tokens are rendered
+    on the calling thread so Streamlit containers keep working. Pass
+    stream_handler instead of stream_container to keep using a handler
+    that already shows status lines.
+    """
+    if stream_handler is None and streaming and stream_container:
+        stream_handler = StreamHandler(stream_container)
+    parts = []
+    for token in iterate_in_loop(astream_ai_response(
+        user_input,
+        chat_history,
+        temperature=temperature,
+        max_tokens=max_tokens,
+        system_prompt=system_prompt,
+        use_cache=use_cache,
+        max_history_tokens=max_history_tokens,
+        memory=memory,
+        history_offset=history_offset,
+        model=model,
+        routing=routing,
+        priority=priority
+    )):
+        parts.append(token)
+        if stream_handler:
+            stream_handler.on_llm_new_token(token)
+    if stream_handler:
+        stream_handler.on_llm_end(None)
+    return "".join(parts)
 
 def regenerate_response(
     user_input: str,
@@ -189,9 +734,15 @@ def regenerate_response(
     max_tokens: int = None,
     system_prompt: str = None,
     streaming: bool = True,
-    stream_container=None
+    stream_container=None,
+    memory: dict = None,
+    history_offset: int = 0,
+    model: str = None,
+    routing: dict = None,
+    priority: int = PRIORITY_REGENERATE
 ) -> str:
     """Regenerate the last AI response with potentially different parameters"""
+    # Always ask the model again; the fresh answer replaces the cached one
     return get_ai_response(
         user_input,
         chat_history,
@@ -199,5 +750,11 @@ def regenerate_response(
         max_tokens,
         system_prompt,
         streaming,
-        stream_container
+        stream_container,
+        use_cache=False,
+        memory=memory,
+        history_offset=history_offset,
+        model=model,
+        routing=routing,
+        priority=priority
     )
@@ -0,0 +1,181 @@
+"""
+Latency histograms for the hot path, exported in Prometheus text format
+"""
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import bisect
+import os
+import threading
+import time
+
+# Upper bounds in seconds, from sub-millisecond DB calls to slow generations
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+RATE_BUCKETS = (5, 10, 25, 50, 100, 200, 400, 800, 1600)
+
+class Histogram:
+    """Cumulative-bucket histogram of one labelled series"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+def _format_labels(labels, extra=None):
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ""
+    escaped = (
+        (k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for k, v in items
+    )
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+class Metrics:
+    """Registry of histograms keyed by metric name and labels.
+
+    Disabled by default: observe() returns immediately and timer() hands
+    back a shared no-op context, so instrumented code costs one attribute
+    check until metrics are switched on.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._help = {}
+        self._buckets = {}
+        self._series = {}  # name -> {labels tuple: Histogram}
+        self._lock = threading.Lock()
+
+    def describe(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        """Declare a histogram's help text and buckets"""
+        self._help[name] = help_text
+        self._buckets[name] = tuple(buckets)
+
+    def observe(self, name, value, **labels):
+        if not self.enabled:
+            return
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram(self._buckets.get(name, DEFAULT_BUCKETS))
+            histogram.observe(value)
+
+    def timer(self, name, **labels):
+        """Context manager that observes the elapsed seconds of its block"""
+        if not self.enabled:
+            return _NULL_TIMER
+        return self._timer(name, labels)
+
+    @contextmanager
+    def _timer(self, name, labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def timed(self, name, **labels):
+        """Decorator form of timer()"""
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.observe(name, time.perf_counter() - start, **labels)
+            return wrapper
+        return decorator
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def render(self) -> str:
+        """All histograms in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            for name in sorted(self._series):
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} histogram")
+                for labels, histogram in sorted(self._series[name].items()):
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets + (float("inf"),), histogram.counts):
+                        cumulative += count
+                        le = "+Inf" if bound == float("inf") else repr(float(bound))
+                        lines.append(f"{name}_bucket{_format_labels(labels, ('le', le))} {cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {histogram.sum!r}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """Write render() to path atomically, e.g. for node_exporter's textfile collector"""
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        os.replace(tmp, path)
+
+    def serve(self, port, host="0.0.0.0"):
+        """Serve /metrics from a daemon thread; returns the HTTP server"""
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+        return server
+
+    def write_periodically(self, path, interval=15.0):
+        """Rewrite the metrics file every interval seconds from a daemon thread"""
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.write(path)
+                except Exception as e:
+                    print(f"Error writing metrics file: {e}")
+
+        threading.Thread(target=loop, name="metrics-file", daemon=True).start()
+
+class _NullTimer:
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+# Shared registry used by the app, engine and database
+metrics = Metrics()
+
+STAGE_SECONDS = "contextiq_stage_seconds"
+DB_SECONDS = "contextiq_db_seconds"
+TOKENS_PER_SECOND = "contextiq_generation_tokens_per_second"
+
+metrics.describe(STAGE_SECONDS, "Duration of each stage of a chat turn in seconds.")
+metrics.describe(DB_SECONDS, "Duration of Database calls in seconds.")
+metrics.describe(TOKENS_PER_SECOND, "Streaming throughput after the first token.", RATE_BUCKETS)
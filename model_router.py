@@ -0,0 +1,136 @@
+"""
+Latency-aware routing across the Groq models with automatic fallback
+"""
+from collections import deque
+import statistics
+import threading
+import time
+
+from rate_limiter import RateLimitQueueFull, RateLimitTimeout
+
+AUTO_MODEL = "auto"
+
+# Errors worth retrying on another model; anything else is returned as is
+FAILOVER_ERRORS = ("rate_limit", "timeout", "server", "local_queue")
+
+# Errors from our own rate limiter queue; the model never saw the request,
+# so they must not count against its health
+LOCAL_ERRORS = ("local_queue",)
+
+def classify_error(e: Exception) -> str:
+    """Map an LLM exception to 'local_queue', 'rate_limit', 'timeout', 'server' or 'other'"""
+    local = (RateLimitQueueFull, RateLimitTimeout)
+    if isinstance(e, local) or isinstance(e.__cause__, local):
+        return "local_queue"
+    status = getattr(e, "status_code", None)
+    # The Groq SDK wraps errors raised while sending (e.g. by the rate limiter)
+    error_str = f"{e} {e.__cause__ or ''}".lower()
+    if status == 429 or "rate_limit" in error_str or "rate limit" in error_str:
+        return "rate_limit"
+    if isinstance(e, TimeoutError) or "timeout" in error_str or "timed out" in error_str:
+        return "timeout"
+    if (status is not None and status >= 500) or "connection" in error_str or "overloaded" in error_str:
+        return "server"
+    return "other"
+
+class ModelStats:
+    """Rolling window of recent outcomes for one model"""
+
+    def __init__(self, window=50):
+        self.outcomes = deque(maxlen=window)  # (time, ttft, tokens_per_sec, error_kind)
+        self.cooldown_until = 0.0
+
+    def record(self, ttft=None, tokens_per_sec=None, error=None):
+        self.outcomes.append((time.time(), ttft, tokens_per_sec, error))
+
+    def ttft(self):
+        values = [o[1] for o in self.outcomes if o[1] is not None]
+        return statistics.median(values) if values else None
+
+    def tokens_per_sec(self):
+        values = [o[2] for o in self.outcomes if o[2]]
+        return statistics.median(values) if values else None
+
+    def error_rate(self):
+        if not self.outcomes:
+            return 0.0
+        return sum(1 for o in self.outcomes if o[3]) / len(self.outcomes)
+
+    def snapshot(self):
+        return {
+            "ttft": self.ttft(),
+            "tokens_per_sec": self.tokens_per_sec(),
+            "error_rate": round(self.error_rate(), 3),
+            "samples": len(self.outcomes),
+            "cooling_down": self.cooldown_until > time.time(),
+        }
+
+class ModelRouter:
+    """Track per-model TTFT, throughput and errors, and order models for a request.
+
+    A model that hits a rate limit or times out is skipped for cooldown
+    seconds, and models whose recent error rate exceeds max_error_rate go
+    to the back of the queue.
+    """
+
+    def __init__(self, models, window=50, cooldown=30.0, max_error_rate=0.5, expected_tokens=300):
+        self.models = list(models)
+        self.cooldown = cooldown
+        self.max_error_rate = max_error_rate
+        self.expected_tokens = expected_tokens
+        self._stats = {m: ModelStats(window) for m in self.models}
+        self._lock = threading.Lock()
+
+    def _get_stats(self, model):
+        if model not in self._stats:
+            self._stats[model] = ModelStats()
+        return self._stats[model]
+
+    def record_success(self, model, ttft, tokens, duration):
+        """Record a completed generation; duration is measured from the first token"""
+        tokens_per_sec = tokens / duration if duration > 0 and tokens > 1 else None
+        with self._lock:
+            self._get_stats(model).record(ttft=ttft, tokens_per_sec=tokens_per_sec)
+
+    def record_error(self, model, kind):
+        with self._lock:
+            stats = self._get_stats(model)
+            stats.record(error=kind)
+            if kind in ("rate_limit", "timeout"):
+                stats.cooldown_until = time.time() + self.cooldown
+
+    def expected_latency(self, model):
+        """Estimated seconds to a full answer, or None if the model has no data yet"""
+        with self._lock:
+            stats = self._get_stats(model)
+            ttft, tps = stats.ttft(), stats.tokens_per_sec()
+        if ttft is None:
+            return None
+        return ttft + (self.expected_tokens / tps if tps else 0.0)
+
+    def _healthy(self, model, now):
+        stats = self._get_stats(model)
+        return stats.cooldown_until <= now and stats.error_rate() <= self.max_error_rate
+
+    def candidates(self, requested):
+        """Models to try in order: the requested one (or fastest for AUTO_MODEL), then fallbacks"""
+        now = time.time()
+        with self._lock:
+            healthy = [m for m in self.models if self._healthy(m, now)]
+            unhealthy = [m for m in self.models if m not in healthy]
+
+        if requested == AUTO_MODEL:
+            # Unmeasured models sort first so every model gets sampled
+            ordered = sorted(
+                healthy,
+                key=lambda m: (self.expected_latency(m) is not None, self.expected_latency(m) or 0.0)
+            )
+        else:
+            ordered = ([requested] if requested in healthy or requested not in self.models else []) + \
+                      [m for m in healthy if m != requested]
+        # Unhealthy models are a last resort rather than never tried
+        return ordered + [m for m in unhealthy if m not in ordered]
+
+    def snapshot(self):
+        with self._lock:
+            return {m: s.snapshot() for m, s in self._stats.items()}
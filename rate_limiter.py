@@ -0,0 +1,290 @@
+"""
+Client-side rate limiting for Groq requests
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+import asyncio
+import heapq
+import itertools
+import json
+import re
+import threading
+import time
+
+from history_manager import estimate_tokens
+
+# Lower value goes first when requests are queued
+PRIORITY_INTERACTIVE = 0
+PRIORITY_REGENERATE = 1
+PRIORITY_SEARCH = 2
+
+# Priority of requests made in the current thread or task
+request_priority = ContextVar("request_priority", default=PRIORITY_INTERACTIVE)
+
+# Model whose next request already waited for capacity (see RateLimiter.admit)
+_admitted = ContextVar("rate_limit_admitted", default=None)
+
+@contextmanager
+def priority_scope(priority: int):
+    """Run the enclosed LLM calls at the given priority"""
+    token = request_priority.set(priority)
+    try:
+        yield
+    finally:
+        request_priority.reset(token)
+
+class RateLimitQueueFull(Exception):
+    """Raised when too many requests are already waiting for capacity"""
+
+class RateLimitTimeout(Exception):
+    """Raised when a request waited longer than max_wait for capacity"""
+
+_DURATION_PART = re.compile(r"([\d.]+)(ms|h|m|s)")
+
+def parse_duration(value) -> float:
+    """Parse Groq reset headers such as '7.66s', '2m59.56s' or '120ms' into seconds"""
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    seconds = 0.0
+    for number, unit in _DURATION_PART.findall(str(value)):
+        seconds += float(number) * {"ms": 0.001, "s": 1, "m": 60, "h": 3600}[unit]
+    return seconds
+
+class TokenBucket:
+    """Classic token bucket refilled continuously at rate_per_minute"""
+
+    def __init__(self, rate_per_minute: float, capacity: float = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until amount is available (amount is capped at capacity)"""
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate if self.rate > 0 else float("inf")
+
+class _ModelLimits:
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.waiters = []  # heap of (priority, seq)
+        self.backoff_until = 0.0
+        self.consecutive_429 = 0
+
+class RateLimiter:
+    """Per-model requests-per-minute and tokens-per-minute limiter with a priority queue.
+
+    Requests wait in a bounded queue, highest priority (lowest number) and
+    then oldest first, until both buckets have capacity. Response headers
+    and 429s from Groq feed back into the buckets and an adaptive backoff.
+    Works from both threads (acquire) and the event loop (aacquire).
+    """
+
+    def __init__(self, requests_per_minute=30, tokens_per_minute=6000, max_queue=64,
+                 max_wait=60.0, max_backoff=60.0):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.max_backoff = max_backoff
+        self._models = {}
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self.stats = {"granted": 0, "waited": 0, "rejected": 0, "timeouts": 0, "throttled_429": 0}
+
+    def _limits(self, model):
+        limits = self._models.get(model)
+        if limits is None:
+            limits = self._models[model] = _ModelLimits(self.requests_per_minute, self.tokens_per_minute)
+        return limits
+
+    def _enqueue(self, model, priority):
+        with self._lock:
+            limits = self._limits(model)
+            if len(limits.waiters) >= self.max_queue:
+                self.stats["rejected"] += 1
+                raise RateLimitQueueFull(f"Rate limit queue full for {model}")
+            ticket = (priority, next(self._seq))
+            heapq.heappush(limits.waiters, ticket)
+            return ticket
+
+    def _dequeue(self, model, ticket):
+        with self._lock:
+            limits = self._limits(model)
+            if ticket in limits.waiters:
+                limits.waiters.remove(ticket)
+                heapq.heapify(limits.waiters)
+
+    def _try_reserve(self, model, ticket, tokens):
+        """Take capacity if ticket is at the head of the queue; else return seconds to wait"""
+        now = time.monotonic()
+        with self._lock:
+            limits = self._limits(model)
+            if limits.backoff_until > now:
+                return limits.backoff_until - now
+            if limits.waiters[0] != ticket:
+                return 0.05
+            limits.requests.refill(now)
+            limits.tokens.refill(now)
+            wait = max(limits.requests.wait_time(1), limits.tokens.wait_time(tokens))
+            if wait > 0:
+                return wait
+            limits.requests.level -= 1
+            limits.tokens.level -= min(tokens, limits.tokens.capacity)
+            heapq.heappop(limits.waiters)
+            self.stats["granted"] += 1
+            return 0.0
+
+    def acquire(self, model, tokens, priority=None):
+        """Block the calling thread until the request may be sent"""
+        ticket = self._enqueue(model, request_priority.get() if priority is None else priority)
+        deadline = time.monotonic() + self.max_wait
+        waited = False
+        try:
+            while True:
+                wait = self._try_reserve(model, ticket, tokens)
+                if wait == 0:
+                    break
+                if time.monotonic() + wait > deadline:
+                    self.stats["timeouts"] += 1
+                    raise RateLimitTimeout(f"Rate limit wait for {model} exceeded {self.max_wait}s")
+                waited = True
+                time.sleep(min(wait, 0.25))
+        except BaseException:
+            self._dequeue(model, ticket)
+            raise
+        if waited:
+            self.stats["waited"] += 1
+
+    async def aacquire(self, model, tokens, priority=None):
+        """Wait on the event loop until the request may be sent"""
+        ticket = self._enqueue(model, request_priority.get() if priority is None else priority)
+        deadline = time.monotonic() + self.max_wait
+        waited = False
+        try:
+            while True:
+                wait = self._try_reserve(model, ticket, tokens)
+                if wait == 0:
+                    break
+                if time.monotonic() + wait > deadline:
+                    self.stats["timeouts"] += 1
+                    raise RateLimitTimeout(f"Rate limit wait for {model} exceeded {self.max_wait}s")
+                waited = True
+                await asyncio.sleep(min(wait, 0.25))
+        except BaseException:
+            self._dequeue(model, ticket)
+            raise
+        if waited:
+            self.stats["waited"] += 1
+
+    async def admit(self, model, tokens, priority=None):
+        """Wait for capacity ahead of the next request to model in this task.
+
+        The HTTP hook then lets that request through without queueing again,
+        so callers can keep queueing time out of their own timeouts.
+        """
+        await self.aacquire(model, tokens, priority)
+        _admitted.set(model)
+
+    def observe(self, model, status_code, headers):
+        """Adapt to Groq's rate-limit headers and 429 responses"""
+        now = time.monotonic()
+        with self._lock:
+            limits = self._limits(model)
+
+            limit_tokens = headers.get("x-ratelimit-limit-tokens")
+            if limit_tokens and limit_tokens.isdigit():
+                # Groq reports tokens per minute here; adopt the real limit
+                tpm = float(limit_tokens)
+                limits.tokens.capacity = tpm
+                limits.tokens.rate = tpm / 60.0
+
+            remaining_tokens = headers.get("x-ratelimit-remaining-tokens")
+            if remaining_tokens and remaining_tokens.isdigit():
+                limits.tokens.refill(now)
+                limits.tokens.level = min(limits.tokens.level, float(remaining_tokens))
+
+            remaining_requests = headers.get("x-ratelimit-remaining-requests")
+            if remaining_requests == "0":
+                reset = parse_duration(headers.get("x-ratelimit-reset-requests"))
+                if reset:
+                    limits.backoff_until = max(limits.backoff_until, now + min(reset, self.max_backoff))
+
+            if status_code == 429:
+                limits.consecutive_429 += 1
+                self.stats["throttled_429"] += 1
+                retry_after = parse_duration(headers.get("retry-after"))
+                backoff = retry_after if retry_after else min(2 ** (limits.consecutive_429 - 1), self.max_backoff)
+                limits.backoff_until = max(limits.backoff_until, now + min(backoff, self.max_backoff))
+            elif status_code < 400:
+                limits.consecutive_429 = 0
+
+    def queue_depth(self):
+        with self._lock:
+            return sum(len(limits.waiters) for limits in self._models.values())
+
+def request_cost(prompt_tokens: int, max_tokens: int) -> int:
+    """Tokens to reserve for a request"""
+    # Completion length is unknown up front; headers correct the estimate later
+    return prompt_tokens + (max_tokens or 0) // 4
+
+def estimate_request_tokens(body: bytes) -> tuple:
+    """(model, estimated tokens) of a chat-completions request body"""
+    try:
+        payload = json.loads(body or b"{}")
+    except ValueError:
+        return None, 0
+    if not isinstance(payload, dict) or "messages" not in payload:
+        return None, 0
+    prompt_tokens = sum(
+        estimate_tokens(m.get("content") if isinstance(m.get("content"), str) else json.dumps(m.get("content")))
+        for m in payload["messages"]
+    )
+    return payload.get("model"), request_cost(prompt_tokens, payload.get("max_tokens"))
+
+def _take_admission(model) -> bool:
+    if _admitted.get() == model:
+        _admitted.set(None)
+        return True
+    return False
+
+def httpx_event_hooks(limiter: RateLimiter) -> tuple:
+    """Sync and async httpx event hooks that run every request through limiter"""
+
+    def on_request(request):
+        model, tokens = estimate_request_tokens(request.content)
+        if model:
+            request.extensions["rate_limit_model"] = model
+            if not _take_admission(model):
+                limiter.acquire(model, tokens)
+
+    def on_response(response):
+        model = response.request.extensions.get("rate_limit_model")
+        if model:
+            limiter.observe(model, response.status_code, response.headers)
+
+    async def aon_request(request):
+        model, tokens = estimate_request_tokens(request.content)
+        if model:
+            request.extensions["rate_limit_model"] = model
+            if not _take_admission(model):
+                await limiter.aacquire(model, tokens)
+
+    async def aon_response(response):
+        on_response(response)
+
+    return (
+        {"request": [on_request], "response": [on_response]},
+        {"request": [aon_request], "response": [aon_response]},
+    )
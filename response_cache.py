@@ -0,0 +1,165 @@
+"""
+Exact-match cache for LLM responses
+"""
+from collections import OrderedDict
+from sqlalchemy import create_engine, Column, String, Text, Float, Integer, func
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+import hashlib
+import json
+import threading
+import time
+
+Base = declarative_base()
+
+class CachedResponse(Base):
+    __tablename__ = 'response_cache'
+
+    key = Column(String(64), primary_key=True)
+    response = Column(Text)
+    size = Column(Integer)
+    created_at = Column(Float, index=True)
+    last_access = Column(Float, index=True)
+
+def history_fingerprint(history: list) -> str:
+    """Stable hash of a LangChain message history"""
+    digest = hashlib.sha256()
+    for msg in history:
+        digest.update(msg.type.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(str(msg.content).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+def make_cache_key(model, temperature, max_tokens, system_prompt, history, user_input) -> str:
+    """Cache key for one generation request"""
+    payload = json.dumps([
+        model, temperature, max_tokens, system_prompt or "",
+        history_fingerprint(history), user_input
+    ])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    """Two-tier response cache: an in-memory LRU and an optional SQLite file.
+
+    Entries older than ttl seconds are treated as misses. The SQLite tier is
+    kept under max_disk_entries and max_disk_bytes by evicting the least
+    recently used rows.
+    """
+
+    def __init__(self, max_entries=512, ttl=24 * 3600, persist_path=None,
+                 max_disk_entries=10000, max_disk_bytes=50 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_disk_entries = max_disk_entries
+        self.max_disk_bytes = max_disk_bytes
+
+        self._memory = OrderedDict()  # key -> (created_at, response)
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+        self.Session = None
+        if persist_path:
+            engine = create_engine(
+                f'sqlite:///{persist_path}',
+                connect_args={'check_same_thread': False}
+            )
+            Base.metadata.create_all(engine)
+            self.Session = sessionmaker(bind=engine)
+
+    def _expired(self, created_at, now):
+        return self.ttl is not None and now - created_at > self.ttl
+
+    def get(self, key):
+        """Return the cached response for key, or None"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if not self._expired(entry[0], now):
+                    self._memory.move_to_end(key)
+                    self.stats["hits"] += 1
+                    return entry[1]
+                del self._memory[key]
+
+        if self.Session is not None:
+            with self.Session.begin() as session:
+                row = session.get(CachedResponse, key)
+                if row is not None:
+                    if self._expired(row.created_at, now):
+                        session.delete(row)
+                    else:
+                        row.last_access = now
+                        response, created_at = row.response, row.created_at
+                        self._remember(key, created_at, response)
+                        with self._lock:
+                            self.stats["hits"] += 1
+                            self.stats["disk_hits"] += 1
+                        return response
+
+        with self._lock:
+            self.stats["misses"] += 1
+        return None
+
+    def put(self, key, response):
+        """Store a response under key"""
+        now = time.time()
+        self._remember(key, now, response)
+        with self._lock:
+            self.stats["stores"] += 1
+
+        if self.Session is not None:
+            with self.Session.begin() as session:
+                session.merge(CachedResponse(
+                    key=key,
+                    response=response,
+                    size=len(response.encode("utf-8")),
+                    created_at=now,
+                    last_access=now
+                ))
+                self._evict_disk(session, now)
+
+    def clear(self):
+        """Drop every cached response"""
+        with self._lock:
+            self._memory.clear()
+        if self.Session is not None:
+            with self.Session.begin() as session:
+                session.query(CachedResponse).delete()
+
+    def _remember(self, key, created_at, response):
+        with self._lock:
+            self._memory[key] = (created_at, response)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def _evict_disk(self, session, now):
+        """Remove expired rows, then least recently used ones over the size limits"""
+        if self.ttl is not None:
+            session.query(CachedResponse).filter(
+                CachedResponse.created_at < now - self.ttl
+            ).delete(synchronize_session=False)
+
+        count, total = session.query(
+            func.count(CachedResponse.key), func.coalesce(func.sum(CachedResponse.size), 0)
+        ).one()
+        if count <= self.max_disk_entries and total <= self.max_disk_bytes:
+            return
+
+        rows = session.query(CachedResponse.key, CachedResponse.size).order_by(
+            CachedResponse.last_access
+        )
+        evict = []
+        for key, size in rows:
+            if count <= self.max_disk_entries and total <= self.max_disk_bytes:
+                break
+            evict.append(key)
+            count -= 1
+            total -= size or 0
+        session.query(CachedResponse).filter(
+            CachedResponse.key.in_(evict)
+        ).delete(synchronize_session=False)
+        with self._lock:
+            self.stats["evictions"] += len(evict)
@@ -0,0 +1,148 @@
+"""
+Query expansion, deduplication, BM25 reranking and packing of web search results
+"""
+from datetime import date
+from urllib.parse import urlsplit, parse_qsl, urlencode
+import hashlib
+import math
+import re
+
+from history_manager import estimate_tokens
+
+# Words ignored when scoring relevance
+STOPWORDS = frozenset(
+    "a an the is are was were be been am do does did of in on at to for from by with about "
+    "and or what whats which who whom how when where why please tell me i you can could would "
+    "should will us our my your it its this that these those there any some".split()
+)
+
+# Words dropped from search cache keys; only ones that never change what a
+# question asks, so "flights from X to Y" and "to X from Y" stay distinct
+CACHE_STOPWORDS = frozenset(["a", "an", "the", "please"])
+
+_WORD_PATTERN = re.compile(r"\w+")
+
+# Splits "X vs Y", "X compared to Y" and multi-part questions into sub-queries
+_SPLIT_PATTERN = re.compile(r"\?\s+|;\s*|\s+(?:vs\.?|versus|compared (?:to|with))\s+", re.IGNORECASE)
+
+_TIME_SENSITIVE = re.compile(r"\b(latest|news|today|current|recent|now|this (?:week|month|year))\b", re.IGNORECASE)
+
+def _words(text: str) -> list:
+    """Lowercase words of text, with contractions joined"""
+    return _WORD_PATTERN.findall(text.lower().replace("'", "").replace("’", ""))
+
+def tokenize(text: str) -> list:
+    """Lowercase content words of text, with contractions joined and stopwords dropped"""
+    return [w for w in _words(text) if w not in STOPWORDS]
+
+def normalize_query(query: str) -> str:
+    """Canonical form of a search query for cache keys.
+
+    Only case, whitespace, punctuation, contractions and articles are
+    normalized. Word order and question or direction words are kept,
+    since they change what a query asks.
+    """
+    words = _words(query)
+    return " ".join(w for w in words if w not in CACHE_STOPWORDS) or " ".join(words)
+
+def query_variants(query: str, max_variants: int = 3) -> list:
+    """Distinct search queries covering query, built locally without an LLM call.
+
+    Comparisons and multi-part questions are split into their parts, long
+    questions get a keyword-only variant, and time-sensitive ones a variant
+    pinned to the current year. Simple questions come back as [query].
+    """
+    variants = [query]
+    parts = [p.strip(" ?.,") for p in _SPLIT_PATTERN.split(query) if len(tokenize(p)) >= 1]
+    if len(parts) > 1:
+        variants.extend(parts)
+
+    keywords = tokenize(query)
+    if len(keywords) > 5:
+        # Longest words are usually the most specific
+        top = sorted(keywords, key=len, reverse=True)[:5]
+        variants.append(" ".join(w for w in keywords if w in top))
+    if _TIME_SENSITIVE.search(query) and str(date.today().year) not in query:
+        variants.append(f"{' '.join(keywords)} {date.today().year}")
+
+    unique, seen = [], set()
+    for variant in variants:
+        key = normalize_query(variant)
+        if key and key not in seen:
+            seen.add(key)
+            unique.append(variant)
+    return unique[:max_variants]
+
+def canonical_url(url: str) -> str:
+    """URL without scheme, www., fragment, tracking parameters or trailing slash"""
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    query = urlencode([(k, v) for k, v in parse_qsl(parts.query) if not k.lower().startswith("utm_")])
+    return f"{host}{parts.path.rstrip('/')}" + (f"?{query}" if query else "")
+
+def content_hash(text: str) -> str:
+    return hashlib.sha1(" ".join(text.lower().split()).encode("utf-8")).hexdigest()
+
+def dedupe_results(results: list) -> list:
+    """Drop results whose URL or text was already seen, keeping the first occurrence.
+
+    Results without text are compared by URL only.
+    """
+    unique, urls, hashes = [], set(), set()
+    for result in results:
+        url = canonical_url(result.get("url", ""))
+        text = (result.get("content") or "").strip()
+        digest = content_hash(text) if text else None
+        if (url and url in urls) or (digest and digest in hashes):
+            continue
+        urls.add(url)
+        if digest:
+            hashes.add(digest)
+        unique.append(result)
+    return unique
+
+def bm25_rank(query: str, results: list, k1: float = 1.5, b: float = 0.75) -> list:
+    """Results sorted by BM25 relevance of their title and text to query.
+
+    Statistics come from the result set itself. Ties keep the incoming
+    order, i.e. the search engine's own ranking.
+    """
+    docs = [tokenize(f"{r.get('title', '')} {r.get('content', '')}") for r in results]
+    if not docs:
+        return []
+    terms = set(tokenize(query))
+    avg_len = sum(len(d) for d in docs) / len(docs) or 1.0
+    doc_freq = {t: sum(1 for d in docs if t in d) for t in terms}
+
+    def score(doc):
+        total = 0.0
+        for term in terms:
+            tf = doc.count(term)
+            if not tf:
+                continue
+            idf = math.log(1 + (len(docs) - doc_freq[term] + 0.5) / (doc_freq[term] + 0.5))
+            total += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len(doc) / avg_len))
+        return total
+
+    scored = sorted(enumerate(results), key=lambda pair: (-score(docs[pair[0]]), pair[0]))
+    return [result for _, result in scored]
+
+def pack_results(results: list, budget_tokens: int, min_tokens: int = 40) -> list:
+    """Take results in order while they fit budget_tokens, trimming the last one to fit"""
+    packed, used = [], 0
+    for result in results:
+        cost = estimate_tokens(f"{result.get('title', '')} {result.get('url', '')}") + 8
+        text = result.get("content", "")
+        text_tokens = estimate_tokens(text)
+        remaining = budget_tokens - used - cost
+        if remaining < min_tokens:
+            break
+        if text_tokens > remaining:
+            # Scale by characters; the estimate is rough anyway
+            text = text[:int(len(text) * remaining / text_tokens)].rsplit(" ", 1)[0] + "..."
+            text_tokens = remaining
+        packed.append({**result, "content": text})
+        used += cost + text_tokens
+    return packed
@@ -0,0 +1,226 @@
+"""
+Fast local decision of whether a question needs a web search
+
+Usage (fit weights to your own labelled questions):
+    python search_router.py train labelled.jsonl weights.json [--epochs 300] [--l2 0.01]
+    python search_router.py eval labelled.jsonl [--weights weights.json]
+
+Each labelled line is {"query": "...", "search": true|false}. The router
+scores a handful of keyword and time-expression features with a logistic
+model; without a weights file it uses the hand-tuned DEFAULT_WEIGHTS.
+Scoring a question takes well under a millisecond (about 20-200µs).
+"""
+from datetime import date
+import argparse
+import json
+import math
+import re
+import sys
+
+# Only the start of a long pasted text is looked at
+MAX_SCAN_CHARS = 1000
+
+# Pasted documents and code are almost always about themselves, not the web
+LONG_INPUT_CHARS = 400
+
+# Feature name -> words and phrases of up to three words; each feature is
+# 1.0 if any of them occurs. Matching is by set lookup on the question's
+# words and word n-grams, so the cost does not grow with the vocabulary.
+KEYWORDS = {
+    "time_expression": """
+        today, tonight, yesterday, tomorrow, currently, current, latest, recent, recently, now,
+        upcoming, nowadays, this week, this weekend, this month, this year, this season, last week,
+        last night, last month, so far, as of, up to date, these days""",
+    "news_event": """
+        news, headline, headlines, breaking, announced, announcement, announces, release, released,
+        launch, launched, launches, election, elections, won, winner, winners, score, scores,
+        standings, update, updates, happened, happening, died, acquired, lawsuit, outage,
+        results of, result of, release date""",
+    "volatile_value": """
+        price, prices, stock, stocks, shares, weather, forecast, rate, rates, market, worth, traffic,
+        delay, delays, schedule, ticket, tickets, availability, exchange rate, how much is,
+        how much does, how much do, cost of, opening hours, open now, open today""",
+    "entity_lookup": """
+        who's, who is, who are, ceo of, president of, prime minister, where is, when is, when does,
+        when will, status of, version of, it down, site down, server down""",
+    "explicit_search": """
+        search, google, online, source, sources, link, links, website, websites, url, urls, cite,
+        look up, look it up, find online, find articles, find sources, on the web, the internet""",
+    "creative_task": """
+        write, poem, story, essay, compose, rewrite, rephrase, translate, summarize, summarise,
+        draft, brainstorm, joke, jokes, lyrics, haiku, limerick, imagine, pretend, roleplay,
+        role play, slogan, name for, names for""",
+    "code_task": """
+        code, function, bug, bugs, debug, refactor, implement, script, regex, sql, class, compile,
+        traceback, exception, algorithm, stack trace, unit test, unit tests""",
+    "math_task": """
+        calculate, solve, prove, derive, equation, integral, derivative, probability, convert""",
+    "conversation_ref": """
+        above, earlier, again, you said, your previous answer, your last answer, your last reply,
+        your last message, this text, my code, my text, my essay, my email, the following""",
+    "definition": """
+        define, explain, what is a, what is an, what are, definition of, meaning of, how does,
+        how do, difference between, why is, why does, why do""",
+}
+KEYWORDS = {
+    name: frozenset(" ".join(phrase.split()) for phrase in phrases.split(","))
+    for name, phrases in KEYWORDS.items()
+}
+
+_WORD_PATTERN = re.compile(r"[a-z0-9']+")
+_MATH_PATTERN = re.compile(r"\d\s*[-+*/^%]\s*\d")
+_CODE_MARKERS = ("```", "()", "=>", "def ", "return ", ";\n", "{\n", "}\n")
+
+FEATURES = list(KEYWORDS) + ["recent_year", "code_snippet", "arithmetic", "long_input", "question"]
+
+# Hand-tuned starting point; replace with weights fitted by "train" on real traffic
+DEFAULT_WEIGHTS = {
+    "bias": -1.6,
+    "weights": {
+        "time_expression": 2.4,
+        "news_event": 2.0,
+        "volatile_value": 2.2,
+        "entity_lookup": 1.2,
+        "explicit_search": 3.5,
+        "recent_year": 2.0,
+        "creative_task": -2.6,
+        "code_task": -2.2,
+        "code_snippet": -2.5,
+        "math_task": -2.2,
+        "arithmetic": -2.0,
+        "conversation_ref": -2.4,
+        "definition": -0.8,
+        "long_input": -2.0,
+        "question": 0.4,
+    },
+    "threshold": 0.5,
+}
+
+def extract_features(query: str) -> dict:
+    """Binary features of query, keyed by the names in FEATURES"""
+    text = query[:MAX_SCAN_CHARS].lower().replace("\u2019", "'")
+    words = _WORD_PATTERN.findall(text)
+    grams = set(words)
+    grams.update(f"{a} {b}" for a, b in zip(words, words[1:]))
+    grams.update(f"{a} {b} {c}" for a, b, c in zip(words, words[1:], words[2:]))
+    features = {name: 0.0 if grams.isdisjoint(keywords) else 1.0 for name, keywords in KEYWORDS.items()}
+    this_year = date.today().year
+    features["recent_year"] = 1.0 if any(
+        len(w) == 4 and w.isdigit() and this_year - 1 <= int(w) <= this_year + 1 for w in words
+    ) else 0.0
+    features["code_snippet"] = 1.0 if any(marker in text for marker in _CODE_MARKERS) else 0.0
+    features["arithmetic"] = 1.0 if _MATH_PATTERN.search(text) else 0.0
+    features["long_input"] = 1.0 if len(query) > LONG_INPUT_CHARS else 0.0
+    features["question"] = 1.0 if text.rstrip().endswith("?") else 0.0
+    return features
+
+def _sigmoid(z):
+    if z < -30:
+        return 0.0
+    return 1.0 / (1.0 + math.exp(-z))
+
+class SearchRouter:
+    """Logistic model over extract_features() predicting whether a question needs fresh web results"""
+
+    def __init__(self, weights=None, bias=None, threshold=None):
+        self.weights = dict(DEFAULT_WEIGHTS["weights"] if weights is None else weights)
+        self.bias = DEFAULT_WEIGHTS["bias"] if bias is None else bias
+        self.threshold = DEFAULT_WEIGHTS["threshold"] if threshold is None else threshold
+
+    @classmethod
+    def load(cls, path):
+        """Router with weights written by "train"; features missing from the file weigh 0"""
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["weights"], data["bias"], data.get("threshold", DEFAULT_WEIGHTS["threshold"]))
+
+    def save(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"bias": self.bias, "weights": self.weights, "threshold": self.threshold}, f, indent=2)
+
+    def probability(self, query: str) -> float:
+        """Estimated probability that answering query needs a web search"""
+        features = extract_features(query)
+        z = self.bias + sum(self.weights.get(name, 0.0) * value for name, value in features.items())
+        return _sigmoid(z)
+
+    def needs_search(self, query: str) -> bool:
+        return self.probability(query) >= self.threshold
+
+def train(examples, epochs=300, learning_rate=0.5, l2=0.01):
+    """Fit a SearchRouter to (query, needs_search) pairs by batch gradient descent"""
+    rows = [(extract_features(query), 1.0 if label else 0.0) for query, label in examples]
+    if not rows:
+        raise ValueError("No training examples")
+    weights = {name: 0.0 for name in FEATURES}
+    bias = 0.0
+    for _ in range(epochs):
+        grad = {name: 0.0 for name in FEATURES}
+        grad_bias = 0.0
+        for features, label in rows:
+            error = _sigmoid(bias + sum(weights[n] * v for n, v in features.items())) - label
+            grad_bias += error
+            for name, value in features.items():
+                if value:
+                    grad[name] += error * value
+        bias -= learning_rate * grad_bias / len(rows)
+        for name in FEATURES:
+            weights[name] -= learning_rate * (grad[name] / len(rows) + l2 * weights[name])
+    return SearchRouter({n: round(w, 4) for n, w in weights.items()}, round(bias, 4))
+
+def evaluate(router, examples):
+    """Accuracy, precision and recall of router on (query, needs_search) pairs"""
+    tp = fp = fn = tn = 0
+    for query, label in examples:
+        predicted = router.needs_search(query)
+        if predicted and label:
+            tp += 1
+        elif predicted:
+            fp += 1
+        elif label:
+            fn += 1
+        else:
+            tn += 1
+    total = tp + fp + fn + tn
+    return {
+        "examples": total,
+        "accuracy": round((tp + tn) / total, 3) if total else None,
+        "precision": round(tp / (tp + fp), 3) if tp + fp else None,
+        "recall": round(tp / (tp + fn), 3) if tp + fn else None,
+    }
+
+def read_examples(path):
+    examples = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                item = json.loads(line)
+                examples.append((item["query"], bool(item["search"])))
+    return examples
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train or evaluate the web search router")
+    commands = parser.add_subparsers(dest="command", required=True)
+    train_parser = commands.add_parser("train", help="Fit weights to labelled questions")
+    train_parser.add_argument("input", help='JSONL of {"query", "search"}')
+    train_parser.add_argument("output", help="Weights file to write (SEARCH_ROUTER_WEIGHTS)")
+    train_parser.add_argument("--epochs", type=int, default=300)
+    train_parser.add_argument("--learning-rate", type=float, default=0.5)
+    train_parser.add_argument("--l2", type=float, default=0.01)
+    eval_parser = commands.add_parser("eval", help="Score a weights file on labelled questions")
+    eval_parser.add_argument("input", help='JSONL of {"query", "search"}')
+    eval_parser.add_argument("--weights", default=None, help="Weights file (default: built-in weights)")
+    args = parser.parse_args(argv)
+
+    examples = read_examples(args.input)
+    if args.command == "train":
+        router = train(examples, args.epochs, args.learning_rate, args.l2)
+        router.save(args.output)
+        print(f"Wrote {args.output}: {evaluate(router, examples)} on the training set", file=sys.stderr)
+    else:
+        router = SearchRouter.load(args.weights) if args.weights else SearchRouter()
+        print(json.dumps(evaluate(router, examples)))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
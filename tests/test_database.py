@@ -0,0 +1,51 @@
+"""
+Database queries whose edge cases are easy to break
+"""
+from pathlib import Path
+import sys
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from database import Database
+
+def test_list_conversations_pages_through_ties(tmp_path):
+    db = Database(str(tmp_path / "paging.db"))
+    db.import_conversations([{
+        "title": f"Conversation {i}",
+        "model": "test-model",
+        "updated_at": "2024-01-01T12:00:00",
+        "messages": [],
+    } for i in range(5)])
+
+    first = db.list_conversations(limit=3)
+    last = first[-1]
+    rest = db.list_conversations(limit=3, before_updated_at=last["updated_at"], before_id=last["id"])
+
+    assert [c["id"] for c in first] == [5, 4, 3]
+    assert [c["id"] for c in rest] == [2, 1]
+
+@pytest.mark.parametrize("compression", [None, "zlib"])
+def test_regenerated_reply_is_rewritten_and_searchable(tmp_path, compression):
+    db = Database(str(tmp_path / "regenerate.db"), compression=compression, compression_min_size=1)
+    conv_id = db.create_conversation("Regenerate", "test-model")
+    db.update_conversation(conv_id, [
+        {"role": "user", "content": "hello world"},
+        {"role": "assistant", "content": "obsolete reply"},
+    ])
+    # Same length, last message replaced in place
+    db.update_conversation(conv_id, [
+        {"role": "user", "content": "hello world"},
+        {"role": "assistant", "content": "brand new reply"},
+    ], dirty_from=1)
+    db.append_messages(conv_id, [
+        {"role": "user", "content": "next question"},
+        {"role": "assistant", "content": "next answer"},
+    ])
+
+    assert [m["content"] for m in db.get_messages(conv_id)] == [
+        "hello world", "brand new reply", "next question", "next answer"
+    ]
+    assert db.search_conversations("obsolete") == []
+    assert [c["id"] for c in db.search_conversations("brand new")] == [conv_id]
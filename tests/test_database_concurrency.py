@@ -0,0 +1,60 @@
+"""
+Many writer and reader threads sharing one Database, as Streamlit script threads do
+"""
+from pathlib import Path
+import sys
+import threading
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from database import Database
+
+WRITERS = 8
+READERS = 8
+WRITES_PER_THREAD = 25
+
+def test_concurrent_writers_and_readers(tmp_path):
+    db = Database(str(tmp_path / "concurrency.db"))
+    errors = []
+    writers_done = threading.Event()
+    start = threading.Barrier(WRITERS + READERS)
+
+    def writer(n):
+        try:
+            start.wait()
+            for i in range(WRITES_PER_THREAD):
+                conv_id = db.create_conversation(f"Writer {n} conversation {i}", "test-model")
+                db.update_conversation(conv_id, [
+                    {"role": "user", "content": f"question {n} {i}"},
+                    {"role": "assistant", "content": f"answer {n} {i}"},
+                ])
+                db.append_messages(conv_id, [{"role": "user", "content": "follow up"}])
+        except Exception as e:
+            errors.append(e)
+
+    def reader():
+        try:
+            start.wait()
+            while not writers_done.is_set():
+                for conv in db.list_conversations(limit=10):
+                    db.get_conversation(conv["id"])
+                db.search_conversations("answer", limit=5)
+                db.count_conversations()
+        except Exception as e:
+            errors.append(e)
+
+    writer_threads = [threading.Thread(target=writer, args=(n,)) for n in range(WRITERS)]
+    reader_threads = [threading.Thread(target=reader) for _ in range(READERS)]
+    for thread in writer_threads + reader_threads:
+        thread.start()
+    for thread in writer_threads:
+        thread.join()
+    writers_done.set()
+    for thread in reader_threads:
+        thread.join()
+
+    assert errors == []
+    assert db.count_conversations() == WRITERS * WRITES_PER_THREAD
+    for conv in db.get_all_conversations():
+        assert conv["message_count"] == 3
+        assert len(db.get_messages(conv["id"])) == 3
@@ -0,0 +1,27 @@
+"""
+Cache keys and result merging for web search
+"""
+from pathlib import Path
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from search_ranking import dedupe_results, normalize_query
+
+def test_dedupe_keeps_distinct_urls_with_empty_content():
+    results = [
+        {"url": "https://example.com/a", "content": ""},
+        {"url": "https://example.com/b", "content": None},
+        {"url": "https://example.com/c"},
+        {"url": "https://example.com/a/", "content": ""},
+        {"url": "https://example.com/d", "content": "same text"},
+        {"url": "https://example.com/e", "content": "same text"},
+    ]
+    assert [r["url"] for r in dedupe_results(results)] == [
+        "https://example.com/a", "https://example.com/b", "https://example.com/c", "https://example.com/d"
+    ]
+
+def test_normalize_query_keeps_direction_and_question_words():
+    assert normalize_query("flights from paris to london") != normalize_query("flights to paris from london")
+    assert normalize_query("when is the election") != normalize_query("where is the election")
+    assert normalize_query("What's  the Weather in Paris?") == normalize_query("what's weather in paris")
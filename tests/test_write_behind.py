@@ -0,0 +1,50 @@
+"""
+Write-behind saves that fail and are retried or dropped
+"""
+from pathlib import Path
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from database import Database
+from write_behind import WriteBehindQueue
+
+class FlakyDatabase:
+    """Database whose first `failures` save_conversations calls raise"""
+
+    def __init__(self, db, failures):
+        self.db = db
+        self.failures = failures
+
+    def save_conversations(self, items):
+        if self.failures > 0:
+            self.failures -= 1
+            raise RuntimeError("database is locked")
+        return self.db.save_conversations(items)
+
+def test_new_conversation_keeps_title_when_first_save_is_dropped(tmp_path):
+    db = Database(str(tmp_path / "write_behind.db"))
+    # One batch attempt plus one single-item attempt per try, for the first try and one retry
+    writer = WriteBehindQueue(FlakyDatabase(db, failures=4), batch_delay=0, max_retries=1)
+    key = writer.new_conversation_key()
+    turn = [{"role": "user", "content": "first question"}, {"role": "assistant", "content": "answer"}]
+    writer.save(key, turn, title="First question", model="test-model")
+    assert writer.flush(timeout=5)
+    assert writer.stats["dropped"] == 1
+    assert writer.resolve(key) is None
+
+    writer.save(key, turn + [{"role": "user", "content": "second"}], model="test-model")
+    assert writer.flush(timeout=5)
+    writer.close()
+
+    conv = db.get_conversation(writer.resolve(key))
+    assert conv["title"] == "First question"
+    assert len(conv["messages"]) == 3
+
+def test_untitled_conversation_is_named_after_first_question(tmp_path):
+    db = Database(str(tmp_path / "untitled.db"))
+    [conv_id] = db.save_conversations([{
+        "conv_id": None, "title": None, "model": "test-model",
+        "messages": [{"role": "user", "content": "How do I rotate a log file?"}],
+    }])
+    assert db.get_conversation(conv_id)["title"] == "How do I rotate a log file?"
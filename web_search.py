@@ -4,27 +4,273 @@ Web search integration using Tavily API
 from langchain_community.tools.tavily_search import TavilySearchResults
 from langchain.agents import AgentExecutor, create_react_agent
 from langchain_core.prompts import PromptTemplate
+from langchain.callbacks.base import BaseCallbackHandler
 import streamlit as st
 
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+import hashlib
+import json
+import threading
+
+from llm_engine import get_secret, get_ai_response, StreamHandler, DEFAULT_SYSTEM_PROMPT
+from rate_limiter import priority_scope, PRIORITY_SEARCH
+from response_cache import ResponseCache
+from search_ranking import normalize_query, query_variants, dedupe_results, bm25_rank, pack_results
+
+# Results fetched per query in the fast pipeline
+SEARCH_MAX_RESULTS = 5
+
+# Queries run in parallel for one question, and the prompt tokens their
+# combined, reranked results may use
+MAX_QUERY_VARIANTS = 3
+SEARCH_CONTEXT_TOKENS = 1500
+
+# Characters of each result's text included in the prompt
+RESULT_MAX_CHARS = 1200
+
+GROUNDED_PROMPT = """{base}
+
+Answer the user's latest message using the web search results below. Cite the \
+results you use inline by number in square brackets, like [1] or [2][3]. If the \
+results do not answer the question, say so, and mark anything you add from general \
+knowledge as such. Today is {today}.
+
+Web search results:
+{sources}"""
+
+def search_cache_key(query: str, max_results: int, search_depth: str) -> str:
+    payload = json.dumps([normalize_query(query), max_results, search_depth])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+# Recent Tavily results by normalized query; short TTL so news stays fresh
+search_cache = ResponseCache(max_entries=256, ttl=15 * 60)
+
+def set_search_cache(cache):
+    """Replace the search result cache, or pass None to disable caching"""
+    global search_cache
+    search_cache = cache
+
+# The Tavily tool is built once per API key and reused
+_search_tool = None
+_search_tool_key = None
+_search_tool_lock = threading.Lock()
+
 def initialize_search_tool():
-    """Initialize Tavily search tool"""
+    """Return the shared Tavily search tool, or None if no API key is set"""
+    global _search_tool, _search_tool_key
     try:
-        api_key = st.secrets.get("TAVILY_API_KEY", "")
+        api_key = get_secret("TAVILY_API_KEY", "")
         if not api_key:
             return None
         
-        search = TavilySearchResults(
-            max_results=3,
-            api_key=api_key
-        )
-        return search
+        with _search_tool_lock:
+            if _search_tool is None or _search_tool_key != api_key:
+                _search_tool = TavilySearchResults(
+                    max_results=3,
+                    api_key=api_key
+                )
+                _search_tool_key = api_key
+            return _search_tool
     except Exception as e:
         st.error(f"Search initialization error: {str(e)}")
         return None
 
-def search_web(query: str, llm) -> str:
+def fetch_search_results(query: str, max_results: int = SEARCH_MAX_RESULTS, search_tool=None) -> list:
+    """Query Tavily directly; returns [{'title', 'url', 'content'}], or None if not configured.
+    
+    Results are cached by normalized query, so variants such as
+    "What's the latest on X?" and "whats the  latest on x" share one search.
     """
-    Perform web search and return formatted results
+    search_tool = search_tool or initialize_search_tool()
+    if not search_tool:
+        return None
+    
+    # Basic depth is a single fast lookup; the LLM does the reading
+    search_depth = "basic"
+    cache_key = None
+    if search_cache is not None:
+        cache_key = search_cache_key(query, max_results, search_depth)
+        cached = search_cache.get(cache_key)
+        if cached is not None:
+            return json.loads(cached)
+    
+    raw = search_tool.api_wrapper.raw_results(query, max_results=max_results, search_depth=search_depth)
+    results = [
+        {
+            "title": result.get("title") or result.get("url", ""),
+            "url": result.get("url", ""),
+            "content": (result.get("content") or "")[:RESULT_MAX_CHARS]
+        }
+        for result in raw.get("results", [])
+    ]
+    if cache_key is not None:
+        search_cache.put(cache_key, json.dumps(results))
+    return results
+
+# Shared by all sessions, so concurrent questions cannot spawn unbounded threads
+_search_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="web-search")
+
+def gather_search_results(query: str, max_variants: int = MAX_QUERY_VARIANTS,
+                          max_results: int = SEARCH_MAX_RESULTS,
+                          budget_tokens: int = SEARCH_CONTEXT_TOKENS) -> tuple:
+    """Search for query and its variants in parallel, then dedupe, rerank and pack the results.
+    
+    Returns (results, queries); results is None if search is not configured.
+    Simple questions produce a single query, so this costs one search call
+    either way; complex ones cost the slowest of their parallel calls.
+    """
+    search_tool = initialize_search_tool()
+    if not search_tool:
+        return None, []
+    
+    queries = query_variants(query, max_variants)
+    futures = [_search_pool.submit(fetch_search_results, q, max_results, search_tool) for q in queries]
+    result_lists, errors = [], []
+    for future in futures:
+        try:
+            result_lists.append(future.result())
+        except Exception as e:
+            errors.append(e)
+    if errors and not result_lists:
+        raise errors[0]
+    
+    # Interleave so each query's top hits come before anyone's tail
+    merged = [
+        results[i]
+        for i in range(max((len(r) for r in result_lists), default=0))
+        for results in result_lists if i < len(results)
+    ]
+    ranked = bm25_rank(query, dedupe_results(merged))
+    return pack_results(ranked, budget_tokens), queries
+
+def build_grounded_prompt(results: list, system_prompt: str = None) -> str:
+    """System prompt with numbered search results for the model to cite"""
+    sources = "\n\n".join(
+        f"[{i}] {result['title']} ({result['url']})\n{result['content']}"
+        for i, result in enumerate(results, 1)
+    ) or "(no results)"
+    # The result is used as a prompt template, so braces in page text must be escaped
+    sources = sources.replace("{", "{{").replace("}", "}}")
+    return GROUNDED_PROMPT.format(
+        base=system_prompt or DEFAULT_SYSTEM_PROMPT,
+        today=date.today().isoformat(),
+        sources=sources
+    )
+
+def format_sources(results: list) -> str:
+    """Numbered source links to append to an answer"""
+    if not results:
+        return ""
+    lines = [f"{i}. [{result['title']}]({result['url']})" for i, result in enumerate(results, 1)]
+    return "\n\n**Sources**\n" + "\n".join(lines)
+
+def answer_with_search(
+    user_input: str,
+    chat_history: list,
+    temperature: float = None,
+    max_tokens: int = None,
+    system_prompt: str = None,
+    streaming: bool = True,
+    stream_container=None,
+    memory: dict = None,
+    history_offset: int = 0,
+    model: str = None,
+    routing: dict = None
+) -> str:
+    """Answer with one Tavily query and one streamed LLM call citing the results.
+    
+    Takes the same arguments as get_ai_response, so the answer sees the
+    conversation history, and is about one LLM round trip slower than a
+    plain answer. search_web is the slower multi-step agent.
+    
+    With a stream_container, progress is shown there ("Searching the web",
+    the number of results, "Answering") until the answer streams in.
+    """
+    stream_handler = StreamHandler(stream_container) if streaming and stream_container else None
+    if stream_handler:
+        stream_handler.on_status("🔍 Searching the web...")
+    try:
+        results, queries = gather_search_results(user_input)
+    except Exception as e:
+        return f"⚠️ Search error: {str(e)}"
+    if results is None:
+        return "⚠️ Web search is not configured. Please add TAVILY_API_KEY to secrets."
+    if stream_handler:
+        searched = f" from {len(queries)} searches" if len(queries) > 1 else ""
+        stream_handler.on_status(f"📄 Found {len(results)} results{searched}. ✍️ Answering...")
+    
+    response = get_ai_response(
+        user_input,
+        chat_history,
+        temperature=temperature,
+        max_tokens=max_tokens,
+        system_prompt=build_grounded_prompt(results, system_prompt),
+        streaming=streaming,
+        memory=memory,
+        history_offset=history_offset,
+        model=model,
+        routing=routing,
+        priority=PRIORITY_SEARCH,
+        stream_handler=stream_handler
+    )
+    sources = format_sources(results)
+    if stream_handler and sources:
+        stream_handler.on_llm_new_token(sources)
+        stream_handler.on_llm_end(None)
+    return response + sources
+
+class AgentStreamCallback(BaseCallbackHandler):
+    """Report a search agent's progress to a StreamHandler and stream its final answer.
+    
+    Tool calls become status lines; the agent's reasoning is hidden, and
+    only the text after "Final Answer:" is forwarded as answer tokens.
+    """
+    
+    MARKER = "Final Answer:"
+    
+    def __init__(self, stream_handler: StreamHandler):
+        self.stream_handler = stream_handler
+        self.searches = 0
+        self._buffer = ""
+        self._forwarded = None
+    
+    def on_llm_start(self, *args, **kwargs) -> None:
+        self._buffer = ""
+        self._forwarded = None
+    
+    on_chat_model_start = on_llm_start
+    
+    def on_llm_new_token(self, token: str, **kwargs) -> None:
+        self._buffer += token
+        if self._forwarded is None:
+            marker_at = self._buffer.find(self.MARKER)
+            if marker_at < 0:
+                return
+            self._forwarded = marker_at + len(self.MARKER)
+        text = self._buffer[self._forwarded:]
+        if self._forwarded and not self.stream_handler.parts:
+            text = text.lstrip()
+        if text:
+            self._forwarded = len(self._buffer)
+            self.stream_handler.on_llm_new_token(text)
+    
+    def on_tool_start(self, serialized, input_str, **kwargs) -> None:
+        self.searches += 1
+        self.stream_handler.on_status(f"🔍 Searching the web ({self.searches}): {input_str}")
+    
+    def on_tool_end(self, output, **kwargs) -> None:
+        count = len(output) if isinstance(output, list) else None
+        if count is None and hasattr(output, "artifact"):
+            count = len(output.artifact.get("results", [])) if isinstance(output.artifact, dict) else None
+        found = f"📄 Found {count} results" if count is not None else "📄 Got results"
+        self.stream_handler.on_status(f"{found}. 🤔 Reading...")
+
+def search_web(query: str, llm, stream_container=None) -> str:
+    """
+    Deep research: a ReAct agent that may search several times before answering.
+    With a stream_container, each search is shown as it happens and the
+    final answer streams in (llm must be a streaming client).
     """
     try:
         search_tool = initialize_search_tool()
@@ -61,13 +307,21 @@ Question: {input}
         agent_executor = AgentExecutor(
             agent=agent,
             tools=tools,
-            verbose=True,
+            verbose=False,
             max_iterations=3,
             handle_parsing_errors=True
         )
         
-        # Execute search
-        result = agent_executor.invoke({"input": query})
+        stream_handler = StreamHandler(stream_container) if stream_container else None
+        callbacks = [AgentStreamCallback(stream_handler)] if stream_handler else []
+        if stream_handler:
+            stream_handler.on_status("🤔 Planning the search...")
+        
+        # Execute search; its LLM calls queue behind interactive chat
+        with priority_scope(PRIORITY_SEARCH):
+            result = agent_executor.invoke({"input": query}, config={"callbacks": callbacks})
+        if stream_handler:
+            stream_handler.on_llm_end(None)
         return result.get("output", "No results found.")
         
     except Exception as e:
@@ -0,0 +1,208 @@
+"""
+Write-behind persistence so saving a chat turn never blocks the UI
+"""
+from collections import OrderedDict
+import atexit
+import threading
+import time
+import uuid
+
+def _min_seq(a, b):
+    """Earlier of two optional seqs"""
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return min(a, b)
+
+class WriteBehindQueue:
+    """Background writer that coalesces and batches conversation saves.
+
+    Saves are keyed by conversation: an int key is an existing conversation
+    id, any other key (see new_conversation_key) stands for a conversation
+    that is created on its first write. Repeated saves of the same key
+    before it is written collapse into one, since each save carries the
+    message list up to the latest turn and the Database only writes the new
+    tail. If a batch fails, its saves are retried one at a time, and saves
+    that still fail are queued again up to max_retries times.
+    """
+
+    def __init__(self, db, max_pending=1000, batch_size=50, batch_delay=0.05, max_retries=3):
+        self.db = db
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.max_retries = max_retries
+
+        self._pending = OrderedDict()
+        self._in_flight = 0
+        self._ids = {}  # Placeholder key -> created conversation id
+        self._dropped = {}  # Placeholder key -> title and model of a dropped first save
+        self._closed = False
+        self._cond = threading.Condition()
+
+        self.stats = {
+            "enqueued": 0, "coalesced": 0, "written": 0, "batches": 0, "errors": 0, "retried": 0, "dropped": 0
+        }
+
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    @staticmethod
+    def new_conversation_key():
+        """Placeholder key for a conversation that has not been created yet"""
+        return f"new-{uuid.uuid4().hex}"
+
+    def save(self, key, messages, title=None, model=None, offset=0, memory=None, dirty_from=None):
+        """Queue a save of the message list; blocks only if the queue is full.
+
+        messages is the conversation from seq offset onwards. memory is an
+        optional rolling summary to store with it. dirty_from is the first
+        seq of already-stored messages that changed in place, if any.
+        """
+        memory = dict(memory) if memory is not None else None
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("WriteBehindQueue is closed")
+            self.stats["enqueued"] += 1
+            if key in self._pending:
+                pending = self._pending[key]
+                pending["messages"] = list(messages)
+                pending["offset"] = offset
+                pending["memory"] = memory or pending["memory"]
+                pending["dirty_from"] = _min_seq(pending["dirty_from"], dirty_from)
+                pending["title"] = pending["title"] or title
+                pending["model"] = pending["model"] or model
+                self.stats["coalesced"] += 1
+                return
+            while len(self._pending) >= self.max_pending and not self._closed:
+                self._cond.wait()
+            self._pending[key] = {
+                "messages": list(messages), "offset": offset, "title": title, "model": model,
+                "memory": memory, "dirty_from": dirty_from
+            }
+            self._cond.notify_all()
+
+    def resolve(self, key):
+        """Get the conversation id for a key, or None if it is not written yet"""
+        if isinstance(key, int):
+            return key
+        with self._cond:
+            return self._ids.get(key)
+
+    @property
+    def queue_depth(self):
+        """Number of saves queued or being written"""
+        with self._cond:
+            return len(self._pending) + self._in_flight
+
+    def flush(self, timeout=None):
+        """Wait until every queued save is committed; returns False on timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._pending or self._in_flight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    def close(self, timeout=10):
+        """Flush outstanding saves and stop the writer thread"""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+    def _take_batch(self):
+        """Pop up to batch_size pending saves, or None once closed and drained"""
+        with self._cond:
+            while not self._pending and not self._closed:
+                self._cond.wait()
+            if not self._pending:
+                return None
+
+        # Give a burst of saves a moment to arrive so they share one commit
+        if self.batch_delay and not self._closed:
+            time.sleep(self.batch_delay)
+
+        with self._cond:
+            batch = []
+            while self._pending and len(batch) < self.batch_size:
+                batch.append(self._pending.popitem(last=False))
+            self._in_flight = len(batch)
+            self._cond.notify_all()
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if batch is None:
+                return
+
+            with self._cond:
+                items = [{
+                    "conv_id": key if isinstance(key, int) else self._ids.get(key),
+                    "title": save["title"] or self._dropped.get(key, {}).get("title"),
+                    "model": save["model"] or self._dropped.get(key, {}).get("model"),
+                    "messages": save["messages"],
+                    "offset": save["offset"],
+                    "memory": save["memory"],
+                    "dirty_from": save["dirty_from"]
+                } for key, save in batch]
+
+            try:
+                saved = list(zip(batch, self.db.save_conversations(items)))
+                failed = []
+            except Exception as e:
+                # One bad save must not take the rest of the batch down with it
+                print(f"Write-behind batch error, saving one at a time: {e}")
+                saved, failed = [], []
+                for entry, item in zip(batch, items):
+                    try:
+                        saved.append((entry, self.db.save_conversations([item])[0]))
+                    except Exception as item_error:
+                        print(f"Write-behind save error: {item_error}")
+                        failed.append(entry)
+
+            with self._cond:
+                for (key, _), conv_id in saved:
+                    if not isinstance(key, int) and conv_id is not None:
+                        self._ids[key] = conv_id
+                        self._dropped.pop(key, None)
+                self.stats["written"] += len(saved)
+                self.stats["batches"] += 1
+                self.stats["errors"] += len(failed)
+                for key, save in failed:
+                    self._requeue(key, save)
+                self._in_flight = 0
+                self._cond.notify_all()
+
+    def _requeue(self, key, save):
+        """Queue a failed save again, merged into any newer save of the same key; call with the lock held"""
+        save["attempts"] = save.get("attempts", 0) + 1
+        if save["attempts"] > self.max_retries:
+            print(f"Write-behind save of {key} dropped after {self.max_retries} retries")
+            self.stats["dropped"] += 1
+            # A later save of a new conversation still needs the title that only the first one carried
+            if not isinstance(key, int) and key not in self._ids:
+                newer = self._pending.get(key)
+                if newer is not None:
+                    newer["title"] = newer["title"] or save["title"]
+                    newer["model"] = newer["model"] or save["model"]
+                else:
+                    self._dropped[key] = {"title": save["title"], "model": save["model"]}
+            return
+        self.stats["retried"] += 1
+        newer = self._pending.get(key)
+        if newer is None:
+            self._pending[key] = save
+            return
+        # The newer save already carries the latest messages; keep what it lacks
+        newer["dirty_from"] = _min_seq(newer["dirty_from"], save["dirty_from"])
+        newer["memory"] = newer["memory"] or save["memory"]
+        newer["title"] = newer["title"] or save["title"]
+        newer["model"] = newer["model"] or save["model"]